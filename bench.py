@@ -0,0 +1,671 @@
+import os
+import sys
+import re
+import json
+import time
+import asyncio
+import logging
+import argparse
+import tracemalloc
+from datetime import datetime
+
+# Keep the live clients from needing real credentials; every backend is swapped for a fake below
+os.environ.setdefault("GROQ_API_KEY", "bench")
+# Keep benchmark output to the tables; warnings still show
+os.environ.setdefault("LOG_LEVEL", "WARNING")
+
+import llama_processor
+import query_parser
+import mongo_utils
+import main
+from fakes import FakeGroqClient, FakeDatabase, MockAsyncDatabase, SCALES, seed, make_tyres, make_orders
+from date_ranges import parse_date_range
+from query_parser import parser_stats
+from extraction_cache import extraction_cache
+
+SAMPLE_TYRES = [
+    {"_id": 1, "brand": "MRF", "model": "ZVTV", "type": "Tubeless", "stock": [{"size": "195/65R15"}]},
+    {"_id": 2, "brand": "Michelin", "model": "Energy XM2", "type": "Tube", "stock": [{"size": "195/65R15"}]},
+]
+
+
+def install_fakes(llm_latency, db_latency, tyres=SAMPLE_TYRES):
+    llama_processor.client = FakeGroqClient(latency=llm_latency)
+    fake_db = FakeDatabase(latency=db_latency, collections={"addtyres": tyres})
+    mongo_utils.db = fake_db
+
+
+async def run_load(total, concurrency, question, distinct):
+    gate = asyncio.Semaphore(concurrency)
+
+    async def one(i):
+        async with gate:
+            await main.ask_question(main.QueryRequest(question=f"{question} #{i}" if distinct else question))
+
+    started = time.perf_counter()
+    await asyncio.gather(*(one(i) for i in range(total)))
+    return total / (time.perf_counter() - started)
+
+
+def bench_concurrency(args):
+    install_fakes(args.llm_latency, args.db_latency)
+    print(f"LLM latency {args.llm_latency * 1000:.0f} ms, Mongo latency {args.db_latency * 1000:.0f} ms")
+    print(f"{'concurrency':>12} {'req/s':>10}")
+    for concurrency in args.concurrency:
+        # Fresh semaphores per run so the limits apply to this event loop
+        llama_processor.llm_semaphore = asyncio.Semaphore(args.llm_limit)
+        mongo_utils.mongo_semaphore = asyncio.Semaphore(args.mongo_limit)
+        extraction_cache.entries.clear()
+        rps = asyncio.run(run_load(args.requests, concurrency, args.question, not args.cache))
+        print(f"{concurrency:>12} {rps:>10.1f}")
+    print("parser:", parser_stats())
+    print("extraction cache:", extraction_cache.snapshot())
+
+
+def open_sync_db(uri, name):
+    # A real mongod when --uri is given, otherwise mongomock (pip install mongomock)
+    if uri:
+        from pymongo import MongoClient
+        return MongoClient(uri)[name]
+    import mongomock
+    return mongomock.MongoClient()[name]
+
+
+def legacy_sales(bench_db, product, period):
+    # The pre-aggregation get_sales: fetch everything, sum in Python
+    tyre_query = {"brand": {"$regex": product, "$options": "i"}} if product else {}
+    tyre_docs = list(bench_db.addtyres.find(tyre_query))
+    tyre_ids = [tyre["_id"] for tyre in tyre_docs]
+    order_query = {}
+    if tyre_ids:
+        order_query["orderItems.tyre"] = {"$in": tyre_ids}
+    if period:
+        order_query["createdAt"] = {"$gte": period[0], "$lt": period[1]}
+    orders = list(bench_db.clientorders.find(order_query))
+    total_quantity = 0
+    total_sales = 0
+    for order in orders:
+        for item in order.get("orderItems", []):
+            if item.get("tyre") in tyre_ids:
+                total_quantity += item.get("quantity", 0)
+                total_sales += item.get("totalPrice", 0)
+    return len(orders), total_quantity, total_sales
+
+
+def pipeline_sales(bench_db, product, period):
+    tyre_query = {"brand": {"$regex": product, "$options": "i"}} if product else {}
+    tyre_ids = [tyre["_id"] for tyre in bench_db.addtyres.find(tyre_query, {"_id": 1})]
+    order_query = {}
+    if tyre_ids:
+        order_query["orderItems.tyre"] = {"$in": tyre_ids}
+    if period:
+        order_query["createdAt"] = {"$gte": period[0], "$lt": period[1]}
+    facets = list(bench_db.clientorders.aggregate(mongo_utils.sales_pipeline(order_query, tyre_ids)))[0]
+    orders = facets["orders"][0]["count"] if facets["orders"] else 0
+    return orders, sum(r["quantity"] for r in facets["by_tyre"]), sum(r["sales"] for r in facets["by_tyre"])
+
+
+def measure(fn, *args):
+    tracemalloc.start()
+    started = time.perf_counter()
+    result = fn(*args)
+    elapsed = time.perf_counter() - started
+    peak = tracemalloc.get_traced_memory()[1]
+    tracemalloc.stop()
+    return result, elapsed, peak
+
+
+def bench_sales(args):
+    bench_db = open_sync_db(args.uri, args.db)
+    bench_db.addtyres.drop()
+    bench_db.clientorders.drop()
+    tyres = make_tyres(args.tyres)
+    bench_db.addtyres.insert_many(tyres)
+    orders = make_orders(args.orders, tyres)
+    for i in range(0, len(orders), 10000):
+        bench_db.clientorders.insert_many(orders[i:i + 10000])
+    bench_db.clientorders.create_index([("orderItems.tyre", 1), ("createdAt", 1)])
+    bench_db.clientorders.create_index("createdAt")
+    del orders
+
+    now = datetime(2025, 1, 1)
+    cases = [("MRF", "last year"), ("MRF", "Q2 2024"), ("Michelin", "last 90 days"), (None, None)]
+    print(f"{args.tyres} tyres, {args.orders} orders")
+    if not args.uri:
+        print("mongomock evaluates pipelines in Python; pass --uri for representative timings")
+    print(f"{'product':>10} {'period':>14} {'legacy ms':>10} {'pipeline ms':>12} {'legacy MB':>10} {'pipeline MB':>12} match")
+    for product, date_range in cases:
+        period = parse_date_range(date_range, now)
+        legacy, legacy_time, legacy_peak = measure(legacy_sales, bench_db, product, period)
+        piped, piped_time, piped_peak = measure(pipeline_sales, bench_db, product, period)
+        print(f"{product or '*':>10} {date_range or '*':>14} {legacy_time * 1000:>10.1f} {piped_time * 1000:>12.1f} "
+              f"{legacy_peak / 1e6:>10.1f} {piped_peak / 1e6:>12.1f} {legacy == piped}")
+
+
+def bench_rollup(args):
+    import sales_rollup
+    if args.uri:
+        from pymongo import MongoClient, AsyncMongoClient
+        sync_db = MongoClient(args.uri)[args.db]
+        async_db = AsyncMongoClient(args.uri)[args.db]
+    else:
+        import mongomock
+        sync_db = mongomock.MongoClient()[args.db]
+        async_db = MockAsyncDatabase(sync_db)
+    tyres, orders = seed(sync_db, args.scale)
+    sync_db.sales_daily.drop()
+    sync_db.rollup_state.drop()
+    mongo_utils.db = async_db
+    # Seeded orders span 2023-2024, so periods are absolute
+    cases = [("MRF", "2024"), ("MRF", "Q2 2024"), ("Michelin", "jan 2023 to mar 2023"), (None, "2023"), (None, None)]
+
+    async def timed(fn, *fn_args):
+        started = time.perf_counter()
+        result = await fn(*fn_args)
+        return result, time.perf_counter() - started
+
+    async def run():
+        mongo_utils.mongo_semaphore = asyncio.Semaphore(32)
+        await mongo_utils.ensure_indexes()
+        started = time.perf_counter()
+        await sales_rollup.rollups.backfill()
+        backfill_time = time.perf_counter() - started
+        print(f"{tyres} tyres, {orders} orders, backfill {backfill_time:.1f}s, "
+              f"{await async_db.sales_daily.count_documents({})} rollup documents")
+        if not args.uri:
+            print("mongomock evaluates pipelines in Python; pass --uri for representative timings")
+        print(f"{'product':>10} {'period':>22} {'raw ms':>10} {'rollup ms':>10} match")
+        mismatches = 0
+        for product, date_range in cases:
+            raw, raw_time = await timed(mongo_utils.get_sales, product, date_range)
+            rolled, rolled_time = await timed(sales_rollup.get_sales, product, date_range)
+            problems = sales_rollup.compare(rolled, raw)
+            mismatches += bool(problems)
+            print(f"{product or '*':>10} {date_range or '*':>22} {raw_time * 1000:>10.1f} {rolled_time * 1000:>10.1f} "
+                  f"{'; '.join(problems) or True}")
+        return 1 if mismatches else 0
+
+    return asyncio.run(run())
+
+
+def install_session_fakes():
+    # The app with an instant fake LLM and the sample catalog in mongomock, so a
+    # follow-up's answer shows whether the session context came through
+    import mongomock
+    sync_db = mongomock.MongoClient().tyres
+    sync_db.addtyres.insert_many([dict(tyre) for tyre in SAMPLE_TYRES])
+    llama_processor.client = FakeGroqClient(latency=0)
+    mongo_utils.db = MockAsyncDatabase(sync_db)
+
+
+def brand_for(j):
+    return SAMPLE_TYRES[j % len(SAMPLE_TYRES)]["brand"]
+
+
+async def open_session(j):
+    await main.ask_question(main.QueryRequest(question=f"List all {brand_for(j)} models", session_id=f"s{j}"))
+
+
+async def continues_session(j):
+    # A brand-less follow-up is only answered for one brand if the context came through
+    answer = await main.ask_question(main.QueryRequest(question="what sizes does it come in?", session_id=f"s{j}"))
+    # "Model ZVTV (MRF): Sizes ..." lines, one per tyre
+    brands = re.findall(r"\(([^()]*)\): Sizes", answer.get("message", "")) if isinstance(answer, dict) else []
+    return bool(brands) and all(brand == brand_for(j) for brand in brands)
+
+
+def session_worker(path, worker, workers, sessions, results):
+    from session_store import SocketSessionStore
+
+    async def run():
+        install_session_fakes()
+        main.session_store = SocketSessionStore(path)
+        # Each worker opens its share of sessions, then continues the next worker's share
+        for j in range(worker, sessions, workers):
+            await open_session(j)
+        results.put(("written", worker))
+        while results.qsize() < workers:
+            await asyncio.sleep(0.01)
+        missing = 0
+        for j in range((worker + 1) % workers, sessions, workers):
+            if not await continues_session(j):
+                missing += 1
+        await main.session_store.close()
+        return missing
+
+    results.put(("missing", asyncio.run(run())))
+
+
+def check_mongo_sessions(workers, sessions, ttl):
+    import mongomock
+    from session_store import MongoSessionStore
+
+    async def run():
+        install_session_fakes()
+        # One store per simulated worker, sharing nothing but the collection
+        collection = MockAsyncDatabase(mongomock.MongoClient().tyres).sessions
+        stores = [MongoSessionStore(collection) for _ in range(workers)]
+        for store in stores:
+            await store.start()
+        missing = 0
+        for j in range(sessions):
+            main.session_store = stores[j % workers]
+            await open_session(j)
+            main.session_store = stores[(j + 1) % workers]
+            if not await continues_session(j):
+                missing += 1
+        indexes = await collection.index_information()
+        ttl_index = any(index.get("expireAfterSeconds") == 0 for index in indexes.values())
+
+        short = MongoSessionStore(collection, ttl=ttl)
+        await short.set("short-lived", {"brand": "MRF"})
+        kept = await short.get("short-lived") == {"brand": "MRF"}
+        await asyncio.sleep(ttl * 2)
+        expired = await short.get("short-lived") == {}
+        return missing, ttl_index, kept, expired
+
+    missing, ttl_index, kept, expired = asyncio.run(run())
+    print(f"{workers} workers, {sessions} sessions over the mongo store: {missing} follow-ups without context, "
+          f"TTL index {'present' if ttl_index else 'MISSING'}, "
+          f"session {'kept' if kept else 'LOST'} within its TTL and {'gone' if expired else 'STILL SERVED'} after it")
+    return missing == 0 and ttl_index and kept and expired
+
+
+def bench_sessions(args):
+    import subprocess
+    import multiprocessing
+    from session_store import MemorySessionStore
+
+    path = f"/tmp/chat-bot-bench-{os.getpid()}.sock"
+    server = subprocess.Popen([sys.executable, "session_store.py", "serve", "--path", path])
+    try:
+        while not os.path.exists(path):
+            time.sleep(0.05)
+        results = multiprocessing.Queue()
+        procs = [
+            multiprocessing.Process(target=session_worker, args=(path, w, args.workers, args.shared_sessions, results))
+            for w in range(args.workers)
+        ]
+        started = time.perf_counter()
+        for proc in procs:
+            proc.start()
+        for proc in procs:
+            proc.join()
+        elapsed = time.perf_counter() - started
+        missing = 0
+        while not results.empty():
+            kind, value = results.get()
+            if kind == "missing":
+                missing += value
+        print(f"{args.workers} workers, {args.shared_sessions} sessions over the socket store: "
+              f"{missing} follow-ups without context, {2 * args.shared_sessions / elapsed:.0f} requests/s")
+    finally:
+        server.terminate()
+        server.wait()
+    passed = check_mongo_sessions(args.workers, args.shared_sessions, args.ttl) and missing == 0
+
+    store = MemorySessionStore(max_size=args.max_sessions)
+    tracemalloc.start()
+    step = args.sessions // 4
+    print(f"in-process store capped at {args.max_sessions} sessions")
+    for i in range(args.sessions):
+        store.set_now(f"session-{i}", {"brand": "MRF", "intent": "list_sizes", "size": "195/65R15"})
+        if (i + 1) % step == 0:
+            current = tracemalloc.get_traced_memory()[0]
+            print(f"{i + 1:>10} sessions seen, {len(store.entries):>8} held, {current / 1e6:8.1f} MB")
+    tracemalloc.stop()
+    # Any follow-up that lost its context fails the run
+    return 0 if passed else 1
+
+
+def load_questions(path):
+    with open(path) as f:
+        return [json.loads(line) for line in f if line.strip()]
+
+
+def bench_batch(args):
+    install_fakes(args.llm_latency, args.db_latency, tyres=make_tyres(args.tyres))
+    if args.no_fast_path:
+        query_parser.MIN_CONFIDENCE = 1.1
+    questions = load_questions(args.questions)
+    reqs = [main.QueryRequest(question=q["question"], session_id=q.get("session_id")) for q in questions]
+
+    def calls():
+        return llama_processor.client.chat.completions.calls, sum(c.calls for c in mongo_utils.db.collections.values())
+
+    async def sequential():
+        return [await main.ask_question(req) for req in reqs]
+
+    async def batched():
+        return (await main.ask_batch(reqs))["results"]
+
+    print(f"{len(reqs)} questions from {args.questions}")
+    print(f"{'mode':>10} {'ms':>8} {'LLM calls':>10} {'DB calls':>9} {'errors':>7}")
+    for name, run in [("sequential", sequential), ("batch", batched)]:
+        llama_processor.llm_semaphore = asyncio.Semaphore(args.llm_limit)
+        mongo_utils.mongo_semaphore = asyncio.Semaphore(args.mongo_limit)
+        extraction_cache.entries.clear()
+        main.session_store.entries.clear()
+        llm_before, db_before = calls()
+        started = time.perf_counter()
+        results = asyncio.run(run())
+        elapsed = time.perf_counter() - started
+        llm_after, db_after = calls()
+        errors = sum(1 for r in results if "error" in r)
+        print(f"{name:>10} {elapsed * 1000:>8.0f} {llm_after - llm_before:>10} {db_after - db_before:>9} {errors:>7}")
+
+
+def bench_stream(args):
+    install_fakes(args.llm_latency, args.db_latency, tyres=make_tyres(args.tyres))
+    question = "sizes for MRF"
+
+    async def buffered():
+        started = time.perf_counter()
+        response = await main.ask_question(main.QueryRequest(question=question))
+        elapsed = time.perf_counter() - started
+        return elapsed, elapsed, len(response["message"])
+
+    async def streamed():
+        started = time.perf_counter()
+        response = await main.ask_question(main.QueryRequest(question=question, stream=args.format))
+        first = None
+        size = 0
+        async for chunk in response.body_iterator:
+            if first is None:
+                first = time.perf_counter() - started
+            size += len(chunk)
+        return first, time.perf_counter() - started, size
+
+    print(f"{args.tyres} tyres, {args.db_latency * 1000:.0f} ms per cursor batch, batch_size {args.batch_size}")
+    print(f"{'mode':>10} {'first ms':>9} {'total ms':>9} {'bytes':>9} {'peak KB':>8}")
+    for name, run in [("buffered", buffered), (args.format, streamed)]:
+        mongo_utils.mongo_semaphore = asyncio.Semaphore(args.mongo_limit)
+        mongo_utils.STREAM_BATCH_SIZE = args.batch_size
+        tracemalloc.start()
+        first, total, size = asyncio.run(run())
+        peak = tracemalloc.get_traced_memory()[1]
+        tracemalloc.stop()
+        print(f"{name:>10} {first * 1000:>9.1f} {total * 1000:>9.1f} {size:>9} {peak / 1e3:>8.0f}")
+
+
+def percentile(values, q):
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, int(q * len(ordered)))]
+
+
+def bench_router(args):
+    from llm_router import LLMRouter, Provider, CircuitBreaker
+    from fakes import FakeProvider
+
+    # Injected failures are expected here; keep the table readable
+    logging.getLogger("llm_router").setLevel(logging.ERROR)
+
+    def make(hedged, outage=False):
+        primary = FakeProvider("primary", latency=args.latency, tail_latency=args.tail_latency, tail_rate=args.tail_rate, seed=1)
+        primary.down = outage
+        providers = [Provider("primary", primary, CircuitBreaker(args.breaker_failures, reset_timeout=60))]
+        secondary = FakeProvider("secondary", latency=args.secondary_latency, seed=2)
+        if hedged:
+            providers.append(Provider("secondary", secondary, CircuitBreaker(args.breaker_failures, reset_timeout=60)))
+        return LLMRouter(providers, min_hedge_delay=args.min_hedge_delay, timeout=args.timeout), primary, secondary
+
+    async def run(router):
+        gate = asyncio.Semaphore(args.concurrency)
+        latencies = []
+        errors = 0
+
+        async def one(i):
+            nonlocal errors
+            async with gate:
+                started = time.perf_counter()
+                try:
+                    await router.extract_query_info(f"types for 195/65R15 #{i}")
+                except Exception:
+                    errors += 1
+                latencies.append(time.perf_counter() - started)
+
+        await asyncio.gather(*(one(i) for i in range(args.requests)))
+        return latencies, errors
+
+    print(f"primary {args.latency * 1000:.0f} ms with {args.tail_rate:.0%} at {args.tail_latency * 1000:.0f} ms, "
+          f"secondary {args.secondary_latency * 1000:.0f} ms")
+    print(f"{'scenario':>16} {'p50 ms':>8} {'p95 ms':>8} {'p99 ms':>8} {'errors':>7} {'primary':>8} {'secondary':>10}")
+    for name, hedged, outage in [("primary only", False, False), ("hedged", True, False),
+                                 ("primary outage", True, True)]:
+        router, primary, secondary = make(hedged, outage)
+        latencies, errors = asyncio.run(run(router))
+        print(f"{name:>16} {percentile(latencies, 0.5) * 1000:>8.0f} {percentile(latencies, 0.95) * 1000:>8.0f} "
+              f"{percentile(latencies, 0.99) * 1000:>8.0f} {errors:>7} {primary.calls:>8} {secondary.calls:>10}")
+
+
+async def asgi_post(app, path, payload):
+    # Minimal in-process HTTP client, so replays go through routing and validation
+    body = json.dumps(payload).encode()
+    scope = {
+        "type": "http", "asgi": {"version": "3.0"}, "http_version": "1.1", "method": "POST",
+        "scheme": "http", "path": path, "raw_path": path.encode(), "query_string": b"", "root_path": "",
+        "headers": [(b"content-type", b"application/json"), (b"content-length", str(len(body)).encode())],
+        "client": ("bench", 0), "server": ("bench", 80),
+    }
+    pending = [{"type": "http.request", "body": body, "more_body": False}]
+    status = None
+    chunks = []
+
+    async def receive():
+        if pending:
+            return pending.pop()
+        # The client never disconnects; block like an idle connection
+        await asyncio.Event().wait()
+
+    async def send(message):
+        nonlocal status
+        if message["type"] == "http.response.start":
+            status = message["status"]
+        elif message["type"] == "http.response.body":
+            chunks.append(message.get("body", b""))
+
+    await app(scope, receive, send)
+    return status, b"".join(chunks)
+
+
+def replay_stats(latencies, elapsed, errors, peak):
+    return {
+        "requests": len(latencies),
+        "errors": errors,
+        "p50_ms": percentile(latencies, 0.5) * 1000,
+        "p95_ms": percentile(latencies, 0.95) * 1000,
+        "p99_ms": percentile(latencies, 0.99) * 1000,
+        "rps": len(latencies) / elapsed,
+        "peak_kb": peak / 1e3,
+    }
+
+
+async def replay_phase(entries, concurrency, memory):
+    gate = asyncio.Semaphore(concurrency)
+    latencies = []
+    errors = 0
+
+    async def one(entry):
+        nonlocal errors
+        payload = {"question": entry["question"], "session_id": entry.get("session_id")}
+        async with gate:
+            started = time.perf_counter()
+            status, _ = await asgi_post(main.app, "/ask", payload)
+            latencies.append(time.perf_counter() - started)
+            if status != 200:
+                errors += 1
+
+    if memory:
+        tracemalloc.start()
+    started = time.perf_counter()
+    await asyncio.gather(*(one(entry) for entry in entries))
+    elapsed = time.perf_counter() - started
+    peak = 0
+    if memory:
+        peak = tracemalloc.get_traced_memory()[1]
+        tracemalloc.stop()
+    return replay_stats(latencies, elapsed, errors, peak)
+
+
+def compare_baseline(results, baseline, tolerance):
+    regressions = []
+    for intent, stats in results.items():
+        before = baseline.get("intents", {}).get(intent)
+        if not before:
+            continue
+        if stats["p95_ms"] > before["p95_ms"] * (1 + tolerance):
+            regressions.append(f"{intent}: p95 {before['p95_ms']:.1f} -> {stats['p95_ms']:.1f} ms")
+        if stats["rps"] < before["rps"] * (1 - tolerance):
+            regressions.append(f"{intent}: rps {before['rps']:.1f} -> {stats['rps']:.1f}")
+    return regressions
+
+
+def bench_replay(args):
+    answers = None
+    if args.llm_responses:
+        answers = {row["question"]: row["response"] for row in load_questions(args.llm_responses)}
+    llama_processor.client = FakeGroqClient(latency=args.llm_latency, answers=answers)
+
+    if args.uri:
+        from pymongo import MongoClient, AsyncMongoClient
+        sync_db = MongoClient(args.uri)[args.db]
+        async_db = AsyncMongoClient(args.uri)[args.db]
+    else:
+        import mongomock
+        sync_db = mongomock.MongoClient()[args.db]
+        async_db = MockAsyncDatabase(sync_db, latency=args.db_latency)
+    tyres, orders = seed(sync_db, args.scale)
+    mongo_utils.db = async_db
+
+    entries = load_questions(args.questions) * args.repeat
+    by_intent = {}
+    for entry in entries:
+        by_intent.setdefault(entry.get("intent", "unlabelled"), []).append(entry)
+
+    async def run():
+        # Semaphores are bound to the loop they are first used on
+        llama_processor.llm_semaphore = asyncio.Semaphore(args.llm_limit)
+        mongo_utils.mongo_semaphore = asyncio.Semaphore(args.mongo_limit)
+        results = {}
+        async with main.lifespan(main.app):
+            for intent, intent_entries in sorted(by_intent.items()):
+                results[intent] = await replay_phase(intent_entries, args.concurrency, not args.no_memory)
+            results["all"] = await replay_phase(entries, args.concurrency, not args.no_memory)
+        return results
+
+    results = asyncio.run(run())
+    print(f"scale {args.scale} ({tyres} tyres, {orders} orders), {len(entries)} questions, concurrency {args.concurrency}")
+    print(f"{'intent':>26} {'n':>5} {'err':>4} {'p50 ms':>8} {'p95 ms':>8} {'p99 ms':>8} {'rps':>8} {'peak KB':>8}")
+    for intent, stats in results.items():
+        print(f"{intent:>26} {stats['requests']:>5} {stats['errors']:>4} {stats['p50_ms']:>8.1f} {stats['p95_ms']:>8.1f} "
+              f"{stats['p99_ms']:>8.1f} {stats['rps']:>8.1f} {stats['peak_kb']:>8.0f}")
+
+    report = {"scale": args.scale, "concurrency": args.concurrency, "intents": results}
+    if args.save_baseline:
+        with open(args.save_baseline, "w") as f:
+            json.dump(report, f, indent=2)
+        print(f"baseline written to {args.save_baseline}")
+    if args.baseline:
+        with open(args.baseline) as f:
+            baseline = json.load(f)
+        regressions = compare_baseline(results, baseline, args.tolerance)
+        for line in regressions:
+            print("REGRESSION", line)
+        if regressions:
+            return 1
+        print(f"no regressions beyond {args.tolerance:.0%} against {args.baseline}")
+    return 0
+
+
+def main_cli(argv=None):
+    parser = argparse.ArgumentParser(description="Benchmarks for the /ask pipeline against local stand-ins")
+    sub = parser.add_subparsers(dest="command", required=True)
+
+    p = sub.add_parser("concurrency", help="requests/sec of /ask with fixed-latency stub backends")
+    p.add_argument("--requests", type=int, default=200)
+    # Default phrasing is outside the fast-path rules so every request reaches the LLM stub
+    p.add_argument("--question", default="Which construction suits 195/65R15?")
+    p.add_argument("--concurrency", type=int, nargs="+", default=[1, 4, 16, 64])
+    p.add_argument("--llm-latency", type=float, default=0.2)
+    p.add_argument("--db-latency", type=float, default=0.02)
+    p.add_argument("--cache", action="store_true", help="repeat one question so the extraction cache can serve it")
+    p.add_argument("--llm-limit", type=int, default=int(os.getenv("LLM_MAX_CONCURRENCY", "8")))
+    p.add_argument("--mongo-limit", type=int, default=int(os.getenv("MONGO_MAX_CONCURRENCY", "32")))
+    p.set_defaults(func=bench_concurrency)
+
+    p = sub.add_parser("sales", help="get_sales aggregation pipeline vs the old Python summation")
+    p.add_argument("--uri", help="local mongod to seed; mongomock is used when omitted")
+    p.add_argument("--db", default="tyres_bench")
+    p.add_argument("--tyres", type=int, default=400)
+    p.add_argument("--orders", type=int, default=100000)
+    p.set_defaults(func=bench_sales)
+
+    p = sub.add_parser("rollup", help="sales answered from daily rollups vs raw clientorders")
+    p.add_argument("--uri", help="local mongod to seed; mongomock is used when omitted")
+    p.add_argument("--db", default="tyres_bench")
+    p.add_argument("--scale", choices=sorted(SCALES), default="small")
+    p.set_defaults(func=bench_rollup)
+
+    p = sub.add_parser("sessions", help="context continuity across worker processes and memory under session churn")
+    p.add_argument("--workers", type=int, default=4)
+    p.add_argument("--shared-sessions", type=int, default=2000, help="sessions continued across workers, per backend")
+    p.add_argument("--ttl", type=float, default=0.5, help="session TTL for the mongo expiry check")
+    p.add_argument("--sessions", type=int, default=2000000)
+    p.add_argument("--max-sessions", type=int, default=100000)
+    p.set_defaults(func=bench_sessions)
+
+    p = sub.add_parser("batch", help="/ask/batch against sequential /ask calls on a recorded question set")
+    p.add_argument("--questions", default="bench_questions.jsonl")
+    p.add_argument("--tyres", type=int, default=200)
+    p.add_argument("--no-fast-path", action="store_true", help="send every question to the LLM stub")
+    p.add_argument("--llm-latency", type=float, default=0.2)
+    p.add_argument("--db-latency", type=float, default=0.02)
+    p.add_argument("--llm-limit", type=int, default=int(os.getenv("LLM_MAX_CONCURRENCY", "8")))
+    p.add_argument("--mongo-limit", type=int, default=int(os.getenv("MONGO_MAX_CONCURRENCY", "32")))
+    p.set_defaults(func=bench_batch)
+
+    p = sub.add_parser("stream", help="time to first chunk of a streamed list_sizes answer vs the buffered one")
+    p.add_argument("--format", choices=["ndjson", "sse"], default="ndjson")
+    p.add_argument("--tyres", type=int, default=20000)
+    p.add_argument("--batch-size", type=int, default=int(os.getenv("STREAM_BATCH_SIZE", "100")))
+    p.add_argument("--llm-latency", type=float, default=0.2)
+    p.add_argument("--db-latency", type=float, default=0.005)
+    p.add_argument("--mongo-limit", type=int, default=int(os.getenv("MONGO_MAX_CONCURRENCY", "32")))
+    p.set_defaults(func=bench_stream)
+
+    p = sub.add_parser("router", help="hedged LLM routing and circuit breaking against fake providers")
+    p.add_argument("--requests", type=int, default=1000)
+    p.add_argument("--concurrency", type=int, default=32)
+    p.add_argument("--latency", type=float, default=0.2)
+    p.add_argument("--tail-latency", type=float, default=2.0)
+    p.add_argument("--tail-rate", type=float, default=0.05)
+    p.add_argument("--secondary-latency", type=float, default=0.3)
+    p.add_argument("--min-hedge-delay", type=float, default=0.25)
+    p.add_argument("--timeout", type=float, default=10.0)
+    p.add_argument("--breaker-failures", type=int, default=5)
+    p.set_defaults(func=bench_router)
+
+    p = sub.add_parser("replay", help="replay a question log against /ask with local stand-ins for Groq and MongoDB")
+    p.add_argument("--questions", default="bench_questions.jsonl")
+    p.add_argument("--repeat", type=int, default=10)
+    p.add_argument("--concurrency", type=int, default=16)
+    p.add_argument("--scale", choices=sorted(SCALES), default="small")
+    p.add_argument("--uri", help="seed and use a local mongod instead of mongomock")
+    p.add_argument("--db", default="tyres_bench")
+    p.add_argument("--llm-latency", type=float, default=0.2)
+    p.add_argument("--llm-responses", help="JSONL of {question, response} canned LLM answers")
+    p.add_argument("--db-latency", type=float, default=0.002, help="per-call latency added to mongomock")
+    p.add_argument("--llm-limit", type=int, default=int(os.getenv("LLM_MAX_CONCURRENCY", "8")))
+    p.add_argument("--mongo-limit", type=int, default=int(os.getenv("MONGO_MAX_CONCURRENCY", "32")))
+    p.add_argument("--no-memory", action="store_true", help="skip tracemalloc, which slows requests down")
+    p.add_argument("--save-baseline", help="write the results to this JSON file")
+    p.add_argument("--baseline", help="compare against this JSON file and exit 1 on regressions")
+    p.add_argument("--tolerance", type=float, default=0.2)
+    p.set_defaults(func=bench_replay)
+
+    args = parser.parse_args(argv)
+    return args.func(args)
+
+
+if __name__ == "__main__":
+    sys.exit(main_cli())
@@ -0,0 +1,289 @@
+import os
+import re
+import time
+import heapq
+import asyncio
+import logging
+from collections import Counter
+
+from pymongo.errors import OperationFailure, PyMongoError
+
+import mongo_utils
+
+# In-memory index over db.addtyres (size -> types, brand -> models -> sizes, type -> sizes)
+# so catalog intents are answered without a collection scan. The collection falls back
+# to direct queries until the first build completes.
+
+logger = logging.getLogger(__name__)
+
+CATALOG_PROJECTION = {"brand": 1, "model": 1, "type": 1, "stock.size": 1, "updatedAt": 1}
+POLL_SECONDS = float(os.getenv("CATALOG_POLL_SECONDS", "30"))
+REBUILD_SECONDS = float(os.getenv("CATALOG_REBUILD_SECONDS", "900"))
+
+
+def compile_pattern(text):
+    # Callers pass the same string the $regex queries used; fall back to a literal match
+    try:
+        return re.compile(text, re.IGNORECASE)
+    except re.error:
+        return re.compile(re.escape(text), re.IGNORECASE)
+
+
+def is_tubeless(entry):
+    return isinstance(entry[2], str) and "tubeless" in entry[2].lower()
+
+
+class CatalogIndex:
+    def __init__(self):
+        self.tyres = {}  # _id -> (brand, model, type, sizes), in catalog order
+        # size/brand -> {_id: position}, each kept in catalog order so lookups never scan self.tyres
+        self.by_size = {}
+        self.by_brand = {}
+        self.tubeless = {}  # brand -> Counter of sizes over its tubeless tyres, plus their count under None
+        self.size_types = {}  # size -> Counter of types among tyres with that size
+        self.position = 0  # increases with every add, so later entries sort last
+        self.ready = False
+        self.high_water = None
+        self.stats = {
+            "mode": "none",
+            "tyres": 0,
+            "builds": 0,
+            "incremental_updates": 0,
+            "last_build_seconds": 0.0,
+            "last_refresh_seconds": 0.0,
+            "synced_at": 0.0,
+        }
+
+    # -- maintenance --
+
+    def add(self, doc):
+        tyre_id = doc["_id"]
+        self.remove(tyre_id)
+        sizes = tuple(item.get("size") for item in doc.get("stock") or [] if item.get("size"))
+        entry = (doc.get("brand"), doc.get("model"), doc.get("type"), sizes)
+        self.tyres[tyre_id] = entry
+        self.position += 1
+        for size in set(sizes):
+            self.by_size.setdefault(size, {})[tyre_id] = self.position
+            self.size_types.setdefault(size, Counter())[entry[2]] += 1
+        self.by_brand.setdefault(entry[0], {})[tyre_id] = self.position
+        if is_tubeless(entry):
+            counts = self.tubeless.setdefault(entry[0], Counter())
+            counts[None] += 1
+            counts.update(set(sizes))
+        updated_at = doc.get("updatedAt")
+        if updated_at is not None and (self.high_water is None or updated_at > self.high_water):
+            self.high_water = updated_at
+
+    def remove(self, tyre_id):
+        entry = self.tyres.pop(tyre_id, None)
+        if entry is None:
+            return
+        for index, key in [(self.by_brand, entry[0])] + [(self.by_size, size) for size in set(entry[3])]:
+            ids = index.get(key)
+            if ids is not None:
+                ids.pop(tyre_id, None)
+                if not ids:
+                    del index[key]
+        for size in set(entry[3]):
+            types = self.size_types.get(size)
+            if types is not None:
+                types[entry[2]] -= 1
+                if types[entry[2]] <= 0:
+                    del types[entry[2]]
+                if not types:
+                    del self.size_types[size]
+        if is_tubeless(entry):
+            counts = self.tubeless[entry[0]]
+            counts.subtract([None, *set(entry[3])])
+            counts = +counts
+            if counts:
+                self.tubeless[entry[0]] = counts
+            else:
+                del self.tubeless[entry[0]]
+
+    async def build(self):
+        started = time.perf_counter()
+        docs = await mongo_utils.find_all(mongo_utils.db.addtyres, {}, CATALOG_PROJECTION)
+        fresh = CatalogIndex()
+        for doc in docs:
+            fresh.add(doc)
+        # Swap in one step so readers never see a half-built index
+        self.tyres, self.by_size, self.by_brand, self.tubeless = fresh.tyres, fresh.by_size, fresh.by_brand, fresh.tubeless
+        self.size_types, self.position = fresh.size_types, fresh.position
+        self.high_water = fresh.high_water
+        self.ready = True
+        elapsed = time.perf_counter() - started
+        self.stats.update(tyres=len(self.tyres), last_build_seconds=elapsed, last_refresh_seconds=elapsed, synced_at=time.time())
+        self.stats["builds"] += 1
+
+    async def poll(self):
+        started = time.perf_counter()
+        query = {"updatedAt": {"$gt": self.high_water}} if self.high_water is not None else {}
+        docs = await mongo_utils.find_all(mongo_utils.db.addtyres, query, CATALOG_PROJECTION)
+        for doc in docs:
+            self.add(doc)
+        self.stats["incremental_updates"] += len(docs)
+        self.stats.update(tyres=len(self.tyres), last_refresh_seconds=time.perf_counter() - started, synced_at=time.time())
+
+    async def follow_changes(self):
+        pipeline = [{"$match": {"operationType": {"$in": ["insert", "update", "replace", "delete"]}}}]
+        async with await mongo_utils.db.addtyres.watch(pipeline, full_document="updateLookup") as stream:
+            self.stats["mode"] = "change_stream"
+            # Anything written between the initial build and opening the stream
+            await self.build()
+            async for change in stream:
+                started = time.perf_counter()
+                if change["operationType"] == "delete" or change.get("fullDocument") is None:
+                    self.remove(change["documentKey"]["_id"])
+                else:
+                    self.add(change["fullDocument"])
+                self.stats["incremental_updates"] += 1
+                self.stats.update(tyres=len(self.tyres), last_refresh_seconds=time.perf_counter() - started, synced_at=time.time())
+
+    async def poll_forever(self):
+        self.stats["mode"] = "polling"
+        last_build = time.monotonic()
+        while True:
+            await asyncio.sleep(POLL_SECONDS)
+            try:
+                # Polling cannot see deletes, so rebuild from scratch now and then
+                if not self.ready or time.monotonic() - last_build >= REBUILD_SECONDS:
+                    await self.build()
+                    last_build = time.monotonic()
+                else:
+                    await self.poll()
+            except PyMongoError as e:
+                logger.warning("catalog refresh failed: %s", e)
+
+    async def refresh_forever(self):
+        while True:
+            try:
+                await self.follow_changes()
+            except OperationFailure as e:
+                # Change streams need a replica set; standalone servers get polled instead
+                logger.info("catalog change stream unavailable (%s), polling every %ss", e, POLL_SECONDS)
+                await self.poll_forever()
+            except PyMongoError as e:
+                logger.warning("catalog change stream interrupted: %s", e)
+                await asyncio.sleep(POLL_SECONDS)
+
+    def snapshot(self):
+        synced_at = self.stats["synced_at"]
+        if self.stats["mode"] == "change_stream":
+            staleness = 0.0
+        else:
+            staleness = time.time() - synced_at if synced_at else None
+        return {**self.stats, "ready": self.ready, "staleness_seconds": staleness}
+
+    # -- lookups, same result shapes as mongo_utils --
+
+    def matching_brands(self, brand):
+        pattern = compile_pattern(brand)
+        return [name for name in self.by_brand if isinstance(name, str) and pattern.search(name)]
+
+    def match_brand(self, brand):
+        if not brand:
+            return list(self.tyres)
+        groups = [self.by_brand[name] for name in self.matching_brands(brand)]
+        if len(groups) == 1:
+            return list(groups[0])
+        # Keep catalog order across brands, as a collection scan would
+        merged = heapq.merge(*(((position, tyre_id) for tyre_id, position in group.items()) for group in groups))
+        return [tyre_id for _, tyre_id in merged]
+
+    def brand_names(self):
+        return [name for name in self.by_brand if isinstance(name, str)]
+
+    def get_type_by_size(self, size):
+        if not size:
+            return {"message": "Please specify a tyre size."}
+        types = self.size_types.get(size)
+        if not types:
+            return {"message": f"No tyres found with size {size}."}
+        tyre_types = [tyre_type for tyre_type in types if tyre_type]
+        if not tyre_types:
+            return {"message": f"Found tyres with size {size}, but their type is not specified."}
+        return {"size": size, "types": tyre_types}
+
+    def get_models_and_sizes(self, brand, intent, size=None):
+        if intent == "list_models":
+            return {"models": [self.tyres[tyre_id][1] for tyre_id in self.match_brand(brand)], "brand": brand}
+        elif intent == "list_sizes":
+            if size:
+                tyre_ids = self.by_size.get(size, {})
+                if brand:
+                    # Walk whichever side is smaller; both are in catalog order
+                    brands = self.matching_brands(brand)
+                    if sum(len(self.by_brand[name]) for name in brands) < len(tyre_ids):
+                        tyre_ids = [tyre_id for tyre_id in self.match_brand(brand) if tyre_id in tyre_ids]
+                    else:
+                        brands = set(brands)
+                        tyre_ids = [tyre_id for tyre_id in tyre_ids if self.tyres[tyre_id][0] in brands]
+                matching_tyres = []
+                for tyre_id in tyre_ids:
+                    tyre_brand, model, _, sizes = self.tyres[tyre_id]
+                    # One row per stock entry of that size, as the MongoDB path returns
+                    matching_tyres.extend({"model": model, "brand": tyre_brand, "size": size} for _ in range(sizes.count(size)))
+                return {"tyres": matching_tyres}
+            model_sizes = []
+            for tyre_id in self.match_brand(brand):
+                tyre_brand, model, _, sizes = self.tyres[tyre_id]
+                model_sizes.append({"model": model, "brand": tyre_brand, "sizes": list(sizes)})
+            return {"model_sizes": model_sizes}
+        else:
+            return {"message": "Intent not recognized or not supported."}
+
+    def get_tubeless_sizes(self, brand):
+        names = self.matching_brands(brand) if brand else list(self.tubeless)
+        count, sizes = 0, set()
+        for name in names:
+            counts = self.tubeless.get(name)
+            if counts:
+                count += counts[None]
+                sizes.update(size for size in counts if size is not None)
+        return {"count": count, "sizes": sorted(sizes)}
+
+
+catalog = CatalogIndex()
+refresh_task = None
+
+
+async def start():
+    global refresh_task
+    try:
+        await catalog.build()
+    except PyMongoError as e:
+        logger.warning("catalog build failed, serving from MongoDB: %s", e)
+    refresh_task = asyncio.create_task(catalog.refresh_forever())
+
+
+async def stop():
+    if refresh_task is not None:
+        refresh_task.cancel()
+
+
+# Catalog lookups that fall back to MongoDB until the index is ready
+
+async def get_type_by_size(size):
+    if catalog.ready:
+        return catalog.get_type_by_size(size)
+    return await mongo_utils.get_type_by_size(size)
+
+
+async def get_models_and_sizes(brand, intent, size=None):
+    if catalog.ready:
+        return catalog.get_models_and_sizes(brand, intent, size)
+    return await mongo_utils.get_models_and_sizes(brand, intent, size)
+
+
+async def get_tubeless_sizes(brand):
+    if catalog.ready:
+        return catalog.get_tubeless_sizes(brand)
+    return await mongo_utils.get_tubeless_sizes(brand)
+
+
+async def get_brands():
+    if catalog.ready:
+        return catalog.brand_names()
+    return await mongo_utils.get_brands()
@@ -0,0 +1,223 @@
+import re
+from datetime import datetime, timedelta
+
+# Turns the free-text period of a sales question into a half-open [start, end) range.
+
+MONTHS = {
+    "jan": 1, "feb": 2, "mar": 3, "apr": 4, "may": 5, "jun": 6,
+    "jul": 7, "aug": 8, "sep": 9, "oct": 10, "nov": 11, "dec": 12,
+}
+MONTH_NAMES = (
+    r"jan(?:uary)?|feb(?:ruary)?|mar(?:ch)?|apr(?:il)?|{may}"
+    r"|june?|july?|aug(?:ust)?|sep(?:t(?:ember)?)?|oct(?:ober)?|nov(?:ember)?|dec(?:ember)?"
+)
+UNIT_DAYS = {"day": 1, "week": 7}
+UNIT_MONTHS = {"month": 1, "quarter": 3, "year": 12}
+NUMBER_WORDS = {
+    "one": 1, "two": 2, "three": 3, "four": 4, "five": 5, "six": 6,
+    "seven": 7, "eight": 8, "nine": 9, "ten": 10, "eleven": 11, "twelve": 12,
+}
+ORDINALS = {"first": 1, "second": 2, "third": 3, "fourth": 4, "1st": 1, "2nd": 2, "3rd": 3, "4th": 4}
+
+YEAR = r"((?:19|20)\d{2})"
+OF_YEAR = r"(?:\s+(?:of\s+)?" + YEAR + r")?"
+ORDINAL = r"(" + "|".join(ORDINALS) + r")"
+DAY = r"(\d{1,2})(?:st|nd|rd|th)?"
+
+# The patterns below are searched for in questions and must match the whole phrase when parsing it
+
+# "last 3 months", "past six weeks", "last 3 weeks of 2024", and "past week" as the
+# trailing seven days ("last week" is the previous calendar week, see NAMED_PATTERN)
+RELATIVE_PATTERN = re.compile(
+    r"\b(?:(?:last|past|previous)\s+(\d+|" + "|".join(NUMBER_WORDS) + r")|past)\s+(day|week|month|quarter|year)s?\b" + OF_YEAR
+)
+# 2024-01-15 and 2024-01
+ISO_DATE_PATTERN = re.compile(r"\b" + YEAR + r"-(\d{1,2})(?:-(\d{1,2}))?\b")
+NAMED_PATTERN = re.compile(r"\b(today|yesterday|(?:last|this|previous|current)\s+(?:year|quarter|month|week))\b")
+# "q1 2024", "q1 of 2024", "2024 q1", "first quarter of 2024"
+QUARTER_PATTERN = re.compile(r"\b(?:q([1-4])|" + ORDINAL + r"\s+quarter)\b" + OF_YEAR + r"|\b" + YEAR + r"\s+q([1-4])\b")
+# "h2 2024", "first half of 2024"
+HALF_PATTERN = re.compile(r"\b(?:h([12])|(first|second|1st|2nd)\s+half)\b" + OF_YEAR)
+# "march 2024", "march 15 2024", "15 march 2024", "15th of march"
+def month_pattern(names):
+    return re.compile(r"\b(?:" + DAY + r"\s+(?:of\s+)?)?(" + names + r")\b(?:\s+" + DAY + r"\b)?(?:,?\s+" + YEAR + r")?")
+
+
+# A bare "may" is too often the verb, so in a question it only counts when a year follows
+MONTH_PATTERN = month_pattern(MONTH_NAMES.format(may=r"may(?=\s+(?:\d{1,2}(?:st|nd|rd|th)?\s+)?(?:19|20)\d{2})"))
+# A phrase already known to be a period may say just "may"
+MONTH_PHRASE_PATTERN = month_pattern(MONTH_NAMES.format(may="may"))
+YEAR_PATTERN = re.compile(r"\b(?:year\s+)?" + YEAR + r"\b")
+SINGLE_PATTERNS = (ISO_DATE_PATTERN, RELATIVE_PATTERN, NAMED_PATTERN, QUARTER_PATTERN, HALF_PATTERN, MONTH_PATTERN, YEAR_PATTERN)
+
+# Any phrase one of the parsers below understands, used to pull the period out of a question
+DATE_PHRASE_PATTERN = "|".join(p.pattern for p in SINGLE_PATTERNS)
+DATE_PHRASE_PATTERN = re.compile(r"\bsince\s+(?:" + DATE_PHRASE_PATTERN + ")|" + DATE_PHRASE_PATTERN)
+RANGE_CONNECTOR = r"\s+(?:to|until|till|through|and)\s+|\s+-\s+|(?<=[a-z\d])-(?=[a-z])|(?<=[a-z])-(?=\d)|(?<=\b\d{4})-(?=\d{4}\b)"
+# Hyphens separate a range only between words or bare years, never inside 2024-01-15
+RANGE_SPLIT_PATTERN = re.compile(RANGE_CONNECTOR)
+# Words that may stand for the end of a range: "from 2023 to now"
+NOW_PATTERN = re.compile(r"now|today|date|present")
+# The second half of a range following a phrase found in a question
+RANGE_CONTINUATION = re.compile(r"(?:" + RANGE_CONNECTOR + r")(?:" + DATE_PHRASE_PATTERN.pattern + r"|\b(?:" + NOW_PATTERN.pattern + r")\b)")
+SINCE_PATTERN = re.compile(r"(?:since|starting(?:\s+from)?)\s+(.+?)(?:\s+(?:to|until|till)\s+(?:" + NOW_PATTERN.pattern + r"))?")
+# Words that carry no period of their own: "during the first half of 2024"
+FILLER_PATTERN = re.compile(r"\b(?:in|of|the|during|for|on|over|within|at)\b")
+# Periods that mean no restriction at all, as opposed to one we failed to parse
+ALL_TIME_PATTERN = re.compile(r"\b(?:all[\s-]time|ever|overall|to date|so far|total)\b")
+
+
+def add_months(year, month, delta):
+    index = year * 12 + (month - 1) + delta
+    return index // 12, index % 12 + 1
+
+
+def month_range(year, month):
+    end_year, end_month = add_months(year, month, 1)
+    return datetime(year, month, 1), datetime(end_year, end_month, 1)
+
+
+def quarter_range(year, quarter):
+    start, _ = month_range(year, 3 * quarter - 2)
+    _, end = month_range(year, 3 * quarter)
+    return start, end
+
+
+def year_range(year):
+    return datetime(year, 1, 1), datetime(year + 1, 1, 1)
+
+
+def parse_single(text, now):
+    # `text` is one normalized period; anything the patterns do not account for gives None
+    today = datetime(now.year, now.month, now.day)
+
+    match = ISO_DATE_PATTERN.fullmatch(text)
+    if match:
+        year, month = int(match.group(1)), int(match.group(2))
+        try:
+            if match.group(3):
+                day = datetime(year, month, int(match.group(3)))
+                return day, day + timedelta(days=1)
+            return month_range(year, month)
+        except ValueError:
+            return None
+
+    match = RELATIVE_PATTERN.fullmatch(text)
+    if match:
+        count = match.group(1) or "1"
+        count = int(count) if count.isdigit() else NUMBER_WORDS[count]
+        unit = match.group(2)
+        # Counted back from the end of the named year, or from today
+        end = year_range(int(match.group(3)))[1] if match.group(3) else today + timedelta(days=1)
+        if unit in UNIT_DAYS:
+            return (end if match.group(3) else today) - timedelta(days=count * UNIT_DAYS[unit]), end
+        if match.group(3):
+            return datetime(*add_months(end.year, end.month, -count * UNIT_MONTHS[unit]), 1), end
+        year, month = add_months(now.year, now.month, -count * UNIT_MONTHS[unit])
+        return datetime(year, month, min(now.day, 28)), end
+
+    match = NAMED_PATTERN.fullmatch(text)
+    if match:
+        phrase = match.group(1).split()
+        if phrase[0] == "today":
+            return today, today + timedelta(days=1)
+        if phrase[0] == "yesterday":
+            return today - timedelta(days=1), today
+        offset = -1 if phrase[0] in ("last", "previous") else 0
+        unit = phrase[1]
+        if unit == "year":
+            return year_range(now.year + offset)
+        if unit == "month":
+            return month_range(*add_months(now.year, now.month, offset))
+        if unit == "quarter":
+            year, month = add_months(now.year, (now.month - 1) // 3 * 3 + 1, 3 * offset)
+            return quarter_range(year, (month - 1) // 3 + 1)
+        start = today - timedelta(days=today.weekday()) + timedelta(weeks=offset)
+        return start, start + timedelta(weeks=1)
+
+    match = QUARTER_PATTERN.fullmatch(text)
+    if match:
+        if match.group(4):
+            return quarter_range(int(match.group(4)), int(match.group(5)))
+        quarter = int(match.group(1)) if match.group(1) else ORDINALS[match.group(2)]
+        return quarter_range(int(match.group(3)) if match.group(3) else now.year, quarter)
+
+    match = HALF_PATTERN.fullmatch(text)
+    if match:
+        half = int(match.group(1)) if match.group(1) else ORDINALS[match.group(2)]
+        year = int(match.group(3)) if match.group(3) else now.year
+        return month_range(year, 6 * half - 5)[0], month_range(year, 6 * half)[1]
+
+    match = MONTH_PHRASE_PATTERN.fullmatch(text)
+    if match:
+        if match.group(1) and match.group(3):
+            return None
+        month = MONTHS[match.group(2)[:3]]
+        day = match.group(1) or match.group(3)
+        if match.group(4):
+            year = int(match.group(4))
+        else:
+            # A month without a year means its most recent occurrence
+            year = now.year if (month, int(day or 1)) <= (now.month, now.day) else now.year - 1
+        if not day:
+            return month_range(year, month)
+        try:
+            start = datetime(year, month, int(day))
+        except ValueError:
+            return None
+        return start, start + timedelta(days=1)
+
+    match = YEAR_PATTERN.fullmatch(text)
+    if match:
+        return year_range(int(match.group(1)))
+
+    return None
+
+
+def normalize(text):
+    text = re.sub(r"[?!.,;:]+(?=\s|$)", " ", text.lower())
+    text = FILLER_PATTERN.sub(" ", text)
+    return re.sub(r"\s+", " ", text).strip()
+
+
+def parse_date_range(text, now=None):
+    if not text:
+        return None
+    now = now or datetime.now()
+    today = datetime(now.year, now.month, now.day)
+    text = re.sub(r"^(?:between|from)\s+", "", normalize(text))
+    # "since 2023" runs from the start of 2023 up to today
+    match = SINCE_PATTERN.fullmatch(text)
+    if match:
+        since = parse_single(match.group(1), now)
+        return (since[0], today + timedelta(days=1)) if since else None
+    # "jan 2024 to mar 2024", "between 2022 and 2023", "from 2023 to now"
+    parts = RANGE_SPLIT_PATTERN.split(text, maxsplit=1)
+    if len(parts) == 2:
+        first = parse_single(parts[0], now)
+        second = (today, today + timedelta(days=1)) if NOW_PATTERN.fullmatch(parts[1]) else parse_single(parts[1], now)
+        year = YEAR_PATTERN.search(parts[1])
+        if first and second and first[0] > second[0] and year and not YEAR_PATTERN.search(parts[0]):
+            # "jan to mar 2024": the year belongs to both ends
+            first = parse_single(f"{parts[0]} {year.group(1)}", now)
+        if first and second:
+            return first[0], max(first[1], second[1])
+        return None
+    return parse_single(text, now)
+
+
+def means_all_time(text):
+    return bool(ALL_TIME_PATTERN.search(text.lower()))
+
+
+def find_date_phrase(text):
+    # The first recognizable period, extended over "to ..." so "jan 2024 to mar 2024" stays whole
+    lowered = text.lower()
+    match = DATE_PHRASE_PATTERN.search(lowered)
+    if not match:
+        return None
+    end = match.end()
+    continuation = RANGE_CONTINUATION.match(lowered, end)
+    if continuation:
+        end = continuation.end()
+    return text[match.start():end].strip()
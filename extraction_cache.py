@@ -0,0 +1,118 @@
+import os
+import re
+import copy
+import json
+import time
+import asyncio
+from collections import OrderedDict
+
+from query_schema import SIZE_PATTERN, normalize_size
+
+# LRU + TTL cache for LLM extraction results with single-flight coalescing:
+# concurrent identical questions share one upstream call.
+
+PUNCTUATION_PATTERN = re.compile(r"[^\w/\s]")
+SPACE_PATTERN = re.compile(r"\s+")
+
+
+def normalize_question(question):
+    q = SIZE_PATTERN.sub(normalize_size, question).lower()
+    q = PUNCTUATION_PATTERN.sub(" ", q)
+    return SPACE_PATTERN.sub(" ", q).strip()
+
+
+def cache_key(question, previous_context=None):
+    # extract_query_info only consults the session for brand and size
+    context = previous_context or {}
+    return "|".join([normalize_question(question), context.get("brand") or "", context.get("size") or ""])
+
+
+class ExtractionCache:
+    def __init__(self, max_size=1024, ttl=3600.0, path=None):
+        self.max_size = max_size
+        self.ttl = ttl
+        self.path = path
+        self.entries = OrderedDict()  # key -> (expires_at, value)
+        self.inflight = {}
+        self.stats = {"hits": 0, "misses": 0, "coalesced": 0, "evictions": 0, "expirations": 0}
+
+    def get(self, key):
+        entry = self.entries.get(key)
+        if entry is None:
+            return None
+        if entry[0] <= time.time():
+            del self.entries[key]
+            self.stats["expirations"] += 1
+            return None
+        self.entries.move_to_end(key)
+        return entry[1]
+
+    def put(self, key, value):
+        self.entries[key] = (time.time() + self.ttl, value)
+        self.entries.move_to_end(key)
+        while len(self.entries) > self.max_size:
+            self.entries.popitem(last=False)
+            self.stats["evictions"] += 1
+
+    def lookup(self, key):
+        value = self.get(key)
+        self.stats["hits" if value is not None else "misses"] += 1
+        return copy.deepcopy(value)
+
+    async def get_or_compute(self, key, compute):
+        value = self.get(key)
+        if value is not None:
+            self.stats["hits"] += 1
+            return copy.deepcopy(value)
+        task = self.inflight.get(key)
+        if task is None:
+            self.stats["misses"] += 1
+            task = asyncio.ensure_future(self._fill(key, compute))
+            self.inflight[key] = task
+        else:
+            self.stats["coalesced"] += 1
+        # Shielded so one cancelled caller does not cancel the call for everyone else
+        value = await asyncio.shield(task)
+        return copy.deepcopy(value)
+
+    async def _fill(self, key, compute):
+        try:
+            value = await compute()
+            # Failed parses are not cached so the next request retries
+            if value is not None:
+                self.put(key, value)
+            return value
+        finally:
+            self.inflight.pop(key, None)
+
+    def load(self):
+        if not self.path or not os.path.exists(self.path):
+            return
+        try:
+            with open(self.path) as f:
+                rows = json.load(f)
+        except (OSError, ValueError):
+            return
+        now = time.time()
+        for key, expires_at, value in rows[-self.max_size:]:
+            if expires_at > now:
+                self.entries[key] = (expires_at, value)
+
+    def save(self):
+        if not self.path:
+            return
+        rows = [[key, expires_at, value] for key, (expires_at, value) in self.entries.items()]
+        tmp_path = self.path + ".tmp"
+        with open(tmp_path, "w") as f:
+            json.dump(rows, f)
+        os.replace(tmp_path, self.path)
+
+    def snapshot(self):
+        return {**self.stats, "size": len(self.entries), "inflight": len(self.inflight)}
+
+
+extraction_cache = ExtractionCache(
+    max_size=int(os.getenv("EXTRACTION_CACHE_SIZE", "1024")),
+    ttl=float(os.getenv("EXTRACTION_CACHE_TTL", "3600")),
+    path=os.getenv("EXTRACTION_CACHE_PATH") or None,
+)
@@ -0,0 +1,270 @@
+import asyncio
+import json
+import random
+import re
+from datetime import datetime, timedelta
+from types import SimpleNamespace
+
+from bson import ObjectId
+
+# Local stand-ins for the Groq and MongoDB clients, used by bench.py
+
+
+QUESTION_LINE = re.compile(r"^\s*(?:User question: |(\d+)\. )(.*)$", re.MULTILINE)
+
+
+def canned_response(kwargs, answers=None):
+    # Answers single and batch extraction prompts from `answers` (question -> JSON
+    # object) or else with the rule-based parse of each question, so replays get
+    # plausible, deterministic JSON
+    from query_parser import parse_query
+
+    prompt = kwargs["messages"][0]["content"]
+    items = []
+    for number, question in QUESTION_LINE.findall(prompt):
+        if answers and question in answers:
+            info = dict(answers[question])
+        else:
+            info = parse_query(question)
+            info.pop("confidence")
+            info["intent"] = info["intent"] or "get_sales"
+        if number:
+            info["id"] = int(number)
+        items.append(info)
+    if "JSON array" in prompt:
+        return json.dumps(items)
+    return json.dumps(items[0] if items else {})
+
+
+class FakeCompletions:
+    def __init__(self, latency, response):
+        self.latency = latency
+        self.response = response
+        self.calls = 0
+
+    async def create(self, **kwargs):
+        self.calls += 1
+        await asyncio.sleep(self.latency)
+        content = self.response(kwargs) if callable(self.response) else self.response
+        message = SimpleNamespace(content=content)
+        return SimpleNamespace(choices=[SimpleNamespace(message=message)])
+
+
+class FakeGroqClient:
+    def __init__(self, latency=0.2, response=None, answers=None):
+        if response is None:
+            response = lambda kwargs: canned_response(kwargs, answers)
+        self.chat = SimpleNamespace(completions=FakeCompletions(latency, response))
+
+
+class FakeProvider:
+    # Stand-in for an llm_router provider's extract_query_info with injectable
+    # latency, a slow tail and failures; set down=True to simulate an outage
+    def __init__(self, name, latency=0.2, tail_latency=None, tail_rate=0.0, failure_rate=0.0, seed=0):
+        self.name = name
+        self.latency = latency
+        self.tail_latency = tail_latency
+        self.tail_rate = tail_rate
+        self.failure_rate = failure_rate
+        self.down = False
+        self.calls = 0
+        self.rng = random.Random(seed)
+
+    async def __call__(self, user_question, previous_context=None):
+        from query_parser import parse_query
+
+        self.calls += 1
+        slow = self.tail_latency is not None and self.rng.random() < self.tail_rate
+        await asyncio.sleep(self.tail_latency if slow else self.latency)
+        if self.down or self.rng.random() < self.failure_rate:
+            raise ConnectionError(f"{self.name} unavailable")
+        info = parse_query(user_question, previous_context)
+        info.pop("confidence")
+        info["intent"] = info["intent"] or "get_sales"
+        return info
+
+
+class FakeCursor:
+    def __init__(self, latency, docs, batch_size=None):
+        self.latency = latency
+        self.docs = docs
+        self.batch_size = batch_size or 101
+
+    async def to_list(self, length=None):
+        await asyncio.sleep(self.latency)
+        return list(self.docs if length is None else self.docs[:length])
+
+    async def __aiter__(self):
+        # One round-trip per batch, as a driver cursor issues getMore
+        for start in range(0, len(self.docs), self.batch_size):
+            await asyncio.sleep(self.latency)
+            for doc in self.docs[start:start + self.batch_size]:
+                yield doc
+
+    async def close(self):
+        pass
+
+
+class FakeCollection:
+    def __init__(self, latency=0.02, docs=None, name="fake"):
+        self.name = name
+        self.latency = latency
+        self.docs = docs or []
+        self.calls = 0
+
+    def find(self, query=None, projection=None, batch_size=None, **kwargs):
+        self.calls += 1
+        return FakeCursor(self.latency, self.docs, batch_size)
+
+    async def aggregate(self, pipeline, **kwargs):
+        # Latency only; shaped like the get_sales $facet output
+        self.calls += 1
+        return FakeCursor(self.latency, [{"orders": [], "by_tyre": []}])
+
+    async def distinct(self, key, query=None):
+        self.calls += 1
+        await asyncio.sleep(self.latency)
+        return sorted({doc[key] for doc in self.docs if doc.get(key) is not None})
+
+
+class FakeDatabase:
+    def __init__(self, latency=0.02, collections=None):
+        self.latency = latency
+        self.collections = {}
+        for name, docs in (collections or {}).items():
+            self.collections[name] = FakeCollection(latency, docs, name)
+
+    def __getattr__(self, name):
+        if name.startswith("_"):
+            raise AttributeError(name)
+        return self[name]
+
+    def __getitem__(self, name):
+        if name not in self.collections:
+            self.collections[name] = FakeCollection(self.latency, name=name)
+        return self.collections[name]
+
+
+# Synthetic addtyres / clientorders documents for seeding a local mongod or mongomock
+
+BRANDS = ["MRF", "Michelin", "Apollo", "CEAT", "Bridgestone", "Goodyear", "JK Tyre", "Pirelli"]
+TYPES = ["Tubeless", "Tube", "Radial", "Run-flat"]
+SIZES = ["145/80R12", "155/65R13", "165/80R14", "175/65R14", "185/65R15", "195/65R15", "205/55R16", "215/60R16", "225/45R17", "235/65R17"]
+
+
+def make_tyres(count, seed=0):
+    rng = random.Random(seed)
+    tyres = []
+    for i in range(count):
+        sizes = rng.sample(SIZES, rng.randint(1, 4))
+        tyres.append({
+            "_id": ObjectId(),
+            "brand": BRANDS[i % len(BRANDS)],
+            "model": f"Model-{i}",
+            "type": rng.choice(TYPES),
+            "stock": [{"size": size, "quantity": rng.randint(0, 50)} for size in sizes],
+            "updatedAt": datetime(2024, 1, 1) + timedelta(minutes=i),
+        })
+    return tyres
+
+
+def make_orders(count, tyres, seed=0, start=datetime(2023, 1, 1), days=730):
+    rng = random.Random(seed)
+    orders = []
+    for _ in range(count):
+        items = []
+        for tyre in rng.sample(tyres, min(len(tyres), rng.randint(1, 3))):
+            quantity = rng.randint(1, 8)
+            items.append({"tyre": tyre["_id"], "quantity": quantity, "totalPrice": quantity * rng.randint(2000, 9000)})
+        created = start + timedelta(seconds=rng.randrange(days * 86400))
+        orders.append({"_id": ObjectId(), "orderItems": items, "createdAt": created, "updatedAt": created})
+    return orders
+
+
+# Dataset sizes for seeding: (tyres, orders)
+# mongomock evaluates queries in Python, so medium and large are meant for a local mongod
+SCALES = {"small": (100, 1000), "medium": (2000, 100000), "large": (10000, 1000000)}
+
+
+def seed(sync_db, scale="small", seed=0):
+    # Works with a pymongo Database or a mongomock one
+    tyre_count, order_count = SCALES[scale]
+    sync_db.addtyres.drop()
+    sync_db.clientorders.drop()
+    tyres = make_tyres(tyre_count, seed)
+    sync_db.addtyres.insert_many(tyres)
+    for start in range(0, order_count, 20000):
+        orders = make_orders(min(20000, order_count - start), tyres, seed + start)
+        sync_db.clientorders.insert_many(orders)
+    return tyre_count, order_count
+
+
+class MockAsyncCursor:
+    def __init__(self, latency, make_docs):
+        self.latency = latency
+        self.make_docs = make_docs
+
+    async def to_list(self, length=None):
+        await asyncio.sleep(self.latency)
+        # Off the event loop, as a networked server would be
+        docs = await asyncio.to_thread(lambda: list(self.make_docs()))
+        return docs if length is None else docs[:length]
+
+    async def __aiter__(self):
+        for doc in await self.to_list():
+            yield doc
+
+    async def close(self):
+        pass
+
+
+class MockAsyncCollection:
+    # The subset of pymongo's AsyncCollection the app uses, over a mongomock
+    # collection, with a fixed network latency per call
+    def __init__(self, collection, latency=0.0):
+        self.collection = collection
+        self.latency = latency
+        self.name = collection.name
+
+    def find(self, *args, batch_size=None, **kwargs):
+        return MockAsyncCursor(self.latency, lambda: self.collection.find(*args, **kwargs))
+
+    async def aggregate(self, pipeline, **kwargs):
+        if pipeline and "$merge" in pipeline[-1]:
+            return MockAsyncCursor(self.latency, lambda: self.merge(pipeline[:-1], pipeline[-1]["$merge"]))
+        return MockAsyncCursor(self.latency, lambda: self.collection.aggregate(pipeline))
+
+    def merge(self, pipeline, spec):
+        # mongomock has no $merge; replace or insert by _id, which is all the app uses
+        target = self.collection.database[spec["into"]]
+        for doc in self.collection.aggregate(pipeline):
+            target.replace_one({"_id": doc["_id"]}, doc, upsert=True)
+        return []
+
+    async def watch(self, *args, **kwargs):
+        from pymongo.errors import OperationFailure
+        # Like a standalone mongod, so the catalog falls back to polling
+        raise OperationFailure("The $changeStream stage is only supported on replica sets", code=40573)
+
+    def __getattr__(self, name):
+        method = getattr(self.collection, name)
+
+        async def call(*args, **kwargs):
+            await asyncio.sleep(self.latency)
+            return await asyncio.to_thread(method, *args, **kwargs)
+
+        return call
+
+
+class MockAsyncDatabase:
+    def __init__(self, sync_db, latency=0.0):
+        self.sync_db = sync_db
+        self.latency = latency
+
+    def __getattr__(self, name):
+        if name.startswith("_"):
+            raise AttributeError(name)
+        return self[name]
+
+    def __getitem__(self, name):
+        return MockAsyncCollection(self.sync_db[name], self.latency)
@@ -1,23 +1,32 @@
 import google.generativeai as genai
 import os
+import time
+import logging
 from dotenv import load_dotenv
-import json
+from metrics import observe, increment, sample_llm_output
+from query_schema import single_prompt, parse_response
 
 load_dotenv()
+logger = logging.getLogger(__name__)
 genai.configure(api_key=os.getenv("GEMINI_API_KEY"))
 
-model = genai.GenerativeModel(model_name="gemini-1.5-pro")
+model = genai.GenerativeModel(model_name=os.getenv("GEMINI_MODEL", "gemini-1.5-pro"))
 
-def extract_query_info(user_question):
-    prompt = f"""
-    Extract the following from the user question for a tyre sales database:
-    - product (e.g., tyre brand)
-    - date range (e.g., last year, 2023, etc.)
-    Return as JSON with keys: product, date_range.
-    User question: {user_question}
-    """
-    response = model.generate_content(prompt)
+async def extract_query_info(user_question, previous_context=None):
+    # Same prompt and output schema as llama_processor.extract_query_info
+    started = time.perf_counter()
+    response = await model.generate_content_async(
+        single_prompt(user_question),
+        generation_config={"temperature": 0.7, "max_output_tokens": 256},
+    )
+    elapsed = time.perf_counter() - started
+    sample_llm_output(response.text)
     try:
-        return json.loads(response.text)
-    except Exception:
-        return None 
\ No newline at end of file
+        info = parse_response(response.text, user_question, previous_context)
+    except Exception as e:
+        increment("llm_parse_errors")
+        logger.warning("could not parse Gemini response: %s", e)
+        observe("llm:gemini", elapsed, "unparsed")
+        return None
+    observe("llm:gemini", elapsed, info.get("intent") if info else "unparsed")
+    return info
@@ -1,61 +1,69 @@
 import os
-from groq import Groq
+import asyncio
+from groq import AsyncGroq
 from dotenv import load_dotenv
-import json
-import re
+import time
+import logging
+from metrics import span, observe, increment, sample_llm_output
+from query_schema import single_prompt, batch_prompt, parse_json_content, normalize_info, parse_response, post_process
 
 load_dotenv()
-client = Groq(api_key=os.getenv("GROQ_API_KEY"))
+logger = logging.getLogger(__name__)
+client = AsyncGroq(api_key=os.getenv("GROQ_API_KEY"))
 
-def extract_query_info(user_question, previous_context=None):
-    prompt = f"""
-    For a tyre management system database, extract the following from the user question:
-    - brand (e.g., MRF, Michelin)
-    - intent: "list_models" if the user wants to know all models for a brand, "list_sizes" if the user wants to know sizes for a brand/model, "get_type_by_size" if the user wants to know the type of a tyre for a specific size, or "get_sales" for sales-related questions.
-    - size (if mentioned, e.g., 195/65R15)
-    Return ONLY valid JSON with keys: brand, intent, size. Do not include any explanation or text before or after the JSON.
-    User question: {user_question}
-    """
-    completion = client.chat.completions.create(
-        model="meta-llama/llama-4-scout-17b-16e-instruct",
-        messages=[
-            {"role": "user", "content": prompt}
-        ],
-        temperature=0.7,
-        max_completion_tokens=256,
-        top_p=1,
-        stream=False,
-        stop=None,
-    )
+# Upper bound on Groq completions in flight per worker
+llm_semaphore = asyncio.Semaphore(int(os.getenv("LLM_MAX_CONCURRENCY", "8")))
+
+async def complete(prompt, max_tokens=256):
+    async with llm_semaphore:
+        completion = await client.chat.completions.create(
+            model="meta-llama/llama-4-scout-17b-16e-instruct",
+            messages=[
+                {"role": "user", "content": prompt}
+            ],
+            temperature=0.7,
+            max_completion_tokens=max_tokens,
+            top_p=1,
+            stream=False,
+            stop=None,
+        )
     content = completion.choices[0].message.content
-    print("LLAMA RAW RESPONSE:", content)
-    # Extract JSON from code block if present
-    if content and "```" in content:
-        json_str = content.split("```", 1)[1]
-        if json_str.startswith("json"):
-            json_str = json_str[4:]
-        json_str = json_str.strip(" \n`")
-    else:
-        json_str = content
+    sample_llm_output(content)
+    return content
+
+async def extract_query_info(user_question, previous_context=None):
+    started = time.perf_counter()
+    content = await complete(single_prompt(user_question))
+    elapsed = time.perf_counter() - started
+    try:
+        info = parse_response(content, user_question, previous_context)
+    except Exception as e:
+        increment("llm_parse_errors")
+        logger.warning("could not parse LLM response: %s", e)
+        observe("llm:groq", elapsed, "unparsed")
+        return None
+    observe("llm:groq", elapsed, info.get("intent") if info else "unparsed")
+    return info
+
+async def extract_query_info_batch(user_questions, previous_contexts=None):
+    # One completion for several questions; returns a list aligned with user_questions,
+    # with None for any item the model did not answer usably
+    previous_contexts = previous_contexts or [None] * len(user_questions)
+    with span("llm:groq", "batch"):
+        content = await complete(batch_prompt(user_questions), max_tokens=96 * len(user_questions) + 64)
+    results = [None] * len(user_questions)
     try:
-        info = json.loads(json_str)
-        # Add post-processing for count intent
-        if isinstance(info, dict):
-            q = user_question.lower()
-            if re.search(r"(type count|number of types|how many types)", q):
-                info["intent"] = "count_type_by_size"
-            # Detect queries for models for a specific size
-            elif re.search(r"models? (available|for|with)? ?(size)? ?[0-9]+/[0-9]+r[0-9]+", q):
-                info["intent"] = "models_and_types_by_size"
-            # Detect queries for tubeless and their sizes for a brand
-            elif re.search(r"tubeless.*sizes?", q) or ("tubeless" in q and "size" in q):
-                info["intent"] = "tubeless_sizes_by_brand"
-            # Fill missing fields from previous_context
-            if previous_context:
-                for key in ["brand", "size"]:
-                    if (key not in info or info[key] is None) and previous_context.get(key):
-                        info[key] = previous_context[key]
-        return info
+        items = parse_json_content(content)
     except Exception as e:
-        print("Groq/Llama API error:", e)
-        return None 
\ No newline at end of file
+        increment("llm_parse_errors")
+        logger.warning("could not parse LLM batch response: %s", e)
+        return results
+    if not isinstance(items, list):
+        return results
+    for item in items:
+        if not isinstance(item, dict):
+            continue
+        index = item.get("id")
+        if isinstance(index, int) and 0 <= index < len(results):
+            results[index] = post_process(normalize_info(item), user_questions[index], previous_contexts[index])
+    return results
@@ -0,0 +1,230 @@
+import os
+import time
+import asyncio
+import logging
+from collections import deque
+
+from metrics import increment
+
+# Routes extraction across LLM providers: the first healthy provider gets the
+# question, and if it has not answered within its recent p95 latency a hedged
+# request goes to the next one. The first valid result wins. Providers that keep
+# raising or timing out are skipped by a circuit breaker until a cool-down has passed.
+
+logger = logging.getLogger(__name__)
+
+LLM_PROVIDERS = os.getenv("LLM_PROVIDERS", "groq")
+LLM_TIMEOUT_SECONDS = float(os.getenv("LLM_TIMEOUT_SECONDS", "10"))
+# Fixed hedge delay in seconds; empty means use the primary's tracked p95, never
+# below LLM_HEDGE_MIN_DELAY, which is also the delay until any latency is tracked
+LLM_HEDGE_DELAY = os.getenv("LLM_HEDGE_DELAY", "")
+LLM_HEDGE_MIN_DELAY = float(os.getenv("LLM_HEDGE_MIN_DELAY", "0.25"))
+BREAKER_FAILURES = int(os.getenv("LLM_BREAKER_FAILURES", "5"))
+BREAKER_RESET_SECONDS = float(os.getenv("LLM_BREAKER_RESET_SECONDS", "30"))
+
+
+class NoProviderAvailable(Exception):
+    pass
+
+
+class CircuitBreaker:
+    def __init__(self, failure_threshold=BREAKER_FAILURES, reset_timeout=BREAKER_RESET_SECONDS):
+        self.failure_threshold = failure_threshold
+        self.reset_timeout = reset_timeout
+        self.failures = 0
+        self.opened_at = None
+        self.probing = False
+
+    @property
+    def state(self):
+        if self.opened_at is None:
+            return "closed"
+        if time.monotonic() - self.opened_at >= self.reset_timeout:
+            return "half_open"
+        return "open"
+
+    def allow(self):
+        state = self.state
+        if state == "closed":
+            return True
+        if state == "half_open" and not self.probing:
+            # One trial request decides whether to close again
+            self.probing = True
+            return True
+        return False
+
+    def record_success(self):
+        self.failures = 0
+        self.opened_at = None
+        self.probing = False
+
+    def record_failure(self):
+        self.failures += 1
+        if self.probing or self.failures >= self.failure_threshold:
+            self.opened_at = time.monotonic()
+        self.probing = False
+
+
+class LatencyTracker:
+    def __init__(self, window=200):
+        self.samples = deque(maxlen=window)
+
+    def record(self, seconds):
+        self.samples.append(seconds)
+
+    def quantile(self, q):
+        if not self.samples:
+            return None
+        ordered = sorted(self.samples)
+        return ordered[min(len(ordered) - 1, int(q * len(ordered)))]
+
+
+class Provider:
+    def __init__(self, name, extract, breaker=None):
+        self.name = name
+        self.extract = extract
+        self.breaker = breaker or CircuitBreaker()
+        self.latency = LatencyTracker()
+        self.stats = {"calls": 0, "wins": 0, "failures": 0, "unusable": 0, "hedges": 0}
+
+    async def call(self, user_question, previous_context, timeout):
+        started = time.perf_counter()
+        try:
+            info = await self.guarded(self.extract(user_question, previous_context), timeout)
+        except asyncio.CancelledError:
+            # A call cancelled after outliving the usual p95 took at least this long;
+            # without the sample a stalled provider's p95 would never rise
+            elapsed = time.perf_counter() - started
+            p95 = self.latency.quantile(0.95)
+            if p95 is not None and elapsed > p95:
+                self.latency.record(elapsed)
+            raise
+        self.latency.record(time.perf_counter() - started)
+        if not info:
+            self.stats["unusable"] += 1
+        return info
+
+    async def guarded(self, awaitable, timeout):
+        # Runs one request against this provider under its breaker and timeout; the
+        # caller is expected to have checked breaker.allow()
+        self.stats["calls"] += 1
+        try:
+            result = await asyncio.wait_for(awaitable, timeout)
+        except asyncio.CancelledError:
+            # Lost the race to another provider; says nothing about health
+            self.breaker.probing = False
+            raise
+        except Exception as e:
+            self.fail(f"{e.__class__.__name__}: {e}")
+            raise
+        # The provider answered, so it is healthy even if the answer was unusable; only
+        # errors and timeouts count towards the breaker, and an empty result loses the race
+        self.breaker.record_success()
+        return result
+
+    def fail(self, reason):
+        self.stats["failures"] += 1
+        self.breaker.record_failure()
+        increment(f"llm_{self.name}_failures")
+        logger.warning("LLM provider %s failed: %s", self.name, reason)
+
+
+class LLMRouter:
+    def __init__(self, providers, hedge_delay=None, min_hedge_delay=LLM_HEDGE_MIN_DELAY, timeout=LLM_TIMEOUT_SECONDS):
+        self.providers = providers
+        self.hedge_delay = hedge_delay
+        self.min_hedge_delay = min_hedge_delay
+        self.timeout = timeout
+
+    def provider(self, name):
+        return next((provider for provider in self.providers if provider.name == name), None)
+
+    def delay_for(self, provider):
+        if self.hedge_delay is not None:
+            return self.hedge_delay
+        p95 = provider.latency.quantile(0.95)
+        return max(self.min_hedge_delay, p95) if p95 is not None else self.min_hedge_delay
+
+    async def extract_query_info(self, user_question, previous_context=None):
+        candidates = iter(self.providers)
+        running = {}
+
+        def launch():
+            for provider in candidates:
+                if provider.breaker.allow():
+                    task = asyncio.ensure_future(provider.call(user_question, previous_context, self.timeout))
+                    running[task] = provider
+                    return provider
+            return None
+
+        primary = launch()
+        if primary is None:
+            raise NoProviderAvailable("every LLM provider's circuit breaker is open")
+        deadline = self.delay_for(primary)
+        last_error = None
+        try:
+            while running:
+                done, _ = await asyncio.wait(running, timeout=deadline, return_when=asyncio.FIRST_COMPLETED)
+                if not done:
+                    # Slower than usual: hedge with the next healthy provider, without a further deadline
+                    hedge = launch()
+                    if hedge is not None:
+                        hedge.stats["hedges"] += 1
+                    deadline = None
+                    continue
+                for task in done:
+                    provider = running.pop(task)
+                    if task.cancelled():
+                        continue
+                    if task.exception() is not None:
+                        last_error = task.exception()
+                    elif task.result():
+                        provider.stats["wins"] += 1
+                        return task.result()
+                if not running:
+                    # Everything in flight failed; fail over immediately
+                    launch()
+            # No provider produced a result; surface the error as a single provider would
+            if last_error is not None:
+                raise last_error
+            return None
+        finally:
+            for task in running:
+                task.cancel()
+
+    def snapshot(self):
+        flat = {}
+        for provider in self.providers:
+            for key, value in provider.stats.items():
+                flat[f"{provider.name}_{key}"] = value
+            flat[f"{provider.name}_breaker_open"] = provider.breaker.state != "closed"
+            for q in (0.5, 0.95):
+                value = provider.latency.quantile(q)
+                if value is not None:
+                    flat[f"{provider.name}_p{int(q * 100)}_seconds"] = value
+        return flat
+
+
+def load_provider(name):
+    if name == "groq":
+        from llama_processor import extract_query_info
+    elif name == "gemini":
+        # google-generativeai is only needed when Gemini is configured
+        from gemini_processor import extract_query_info
+    else:
+        raise ValueError(f"unknown LLM provider {name!r}")
+    return Provider(name, extract_query_info)
+
+
+def create_router(names=LLM_PROVIDERS):
+    providers = []
+    for name in [n.strip() for n in names.split(",") if n.strip()]:
+        try:
+            providers.append(load_provider(name))
+        except ImportError as e:
+            logger.warning("LLM provider %s unavailable: %s", name, e)
+    hedge_delay = float(LLM_HEDGE_DELAY) if LLM_HEDGE_DELAY else None
+    return LLMRouter(providers, hedge_delay=hedge_delay)
+
+
+router = create_router()
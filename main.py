@@ -1,23 +1,270 @@
-from fastapi import FastAPI
+import os
+import copy
+import json
+import time
+import asyncio
+import logging
+from contextlib import asynccontextmanager
+from fastapi import FastAPI, Request
+from fastapi.responses import PlainTextResponse, StreamingResponse
 from pydantic import BaseModel
-from llama_processor import extract_query_info
-from mongo_utils import get_sales, get_models_and_sizes, get_type_by_size, db
-from typing import Optional
+from llama_processor import extract_query_info_batch
+from llm_router import router
+from query_parser import fast_extract, load_brands, parser_stats
+from extraction_cache import extraction_cache, cache_key
+from mongo_utils import ensure_indexes, stream_models_and_sizes
+import mongo_utils
+from catalog import get_models_and_sizes, get_type_by_size, get_tubeless_sizes
+import catalog
+import sales_rollup
+from sales_rollup import get_sales
+from session_store import create_session_store
+from pymongo.errors import PyMongoError
+from date_ranges import find_date_phrase, means_all_time, parse_date_range
+import metrics
+from metrics import span, observe, increment, current_intent, current_waits, Waits
+from typing import List, Literal, Optional
 
-app = FastAPI()
+@asynccontextmanager
+async def lifespan(app):
+    extraction_cache.load()
+    if os.getenv("MONGO_CREATE_INDEXES", "1") == "1":
+        try:
+            await ensure_indexes()
+        except PyMongoError as e:
+            logger.warning("could not create indexes: %s", e)
+    await session_store.start()
+    await catalog.start()
+    await sales_rollup.start()
+    yield
+    await sales_rollup.stop()
+    await catalog.stop()
+    await session_store.close()
+    extraction_cache.save()
+
+app = FastAPI(lifespan=lifespan)
+logger = logging.getLogger(__name__)
+# uvicorn only configures its own loggers, so the app's (sampled LLM output, refresh
+# and fallback warnings) need a handler of their own
+logging.basicConfig(level=os.getenv("LOG_LEVEL", "INFO").upper(), format="%(asctime)s %(levelname)s %(name)s: %(message)s")
+
+# Questions packed into one extraction prompt by /ask/batch
+BATCH_LLM_SIZE = int(os.getenv("BATCH_LLM_SIZE", "10"))
+
+# Intents whose answers can be streamed chunk by chunk, and the supported framings
+STREAMABLE_INTENTS = {"list_sizes", "models_and_types_by_size"}
+STREAM_MEDIA_TYPES = {"ndjson": "application/x-ndjson", "sse": "text/event-stream"}
 
 class QueryRequest(BaseModel):
     question: str
     session_id: Optional[str] = None
+    # Opt-in streaming for large list answers; ignored by /ask/batch
+    stream: Optional[Literal["ndjson", "sse"]] = None
 
-# In-memory session context store
-session_context = {}
+# Session context store, bounded and optionally shared across workers (see session_store.py)
+session_store = create_session_store()
 
-@app.post("/ask")
-async def ask_question(req: QueryRequest):
+if metrics.PROFILE_REQUESTS != "0":
+    @app.middleware("http")
+    async def profile(request: Request, call_next):
+        if metrics.should_profile(request):
+            return await metrics.profile_request(request, call_next)
+        return await call_next(request)
+
+def component_stats():
+    return {
+        "parser": parser_stats(),
+        "extraction_cache": extraction_cache.snapshot(),
+        "catalog": catalog.catalog.snapshot(),
+        "sessions": session_store.snapshot(),
+        "sales_rollups": sales_rollup.rollups.snapshot(),
+        "llm_router": router.snapshot(),
+    }
+
+@app.get("/stats")
+async def stats():
+    return component_stats()
+
+@app.get("/metrics", response_class=PlainTextResponse)
+async def prometheus_metrics():
+    return PlainTextResponse(metrics.render(component_stats()), media_type="text/plain; version=0.0.4")
+
+class Lookups:
+    # Memoizes catalog and sales lookups per request, so the items of a batch that
+    # need the same size or brand share one query
+    def __init__(self):
+        self.tasks = {}
+
+    def call(self, fn, *args):
+        key = (fn.__name__,) + args
+        task = self.tasks.get(key)
+        if task is None:
+            task = self.tasks[key] = asyncio.ensure_future(fn(*args))
+        return metrics.waiting(task)
+
+async def extract_with_router(question, context):
+    # No provider available, or the one tried failed: answer like an unparsed reply
+    try:
+        return await router.extract_query_info(question, previous_context=context)
+    except Exception as e:
+        increment("llm_unavailable")
+        logger.warning("LLM extraction failed: %s: %s", e.__class__.__name__, e)
+        return None
+
+async def extract_batch(questions, contexts):
+    # Batch prompts only go to Groq, behind the same breaker and timeout the router
+    # uses; while it is unavailable every item takes the per-question router path
+    groq = router.provider("groq")
+    if groq is None or not groq.breaker.allow():
+        return [None] * len(questions)
+    return await groq.guarded(extract_query_info_batch(questions, contexts), router.timeout)
+
+async def load_context(req):
     # Retrieve previous context for this session, or empty dict
-    context = session_context.get(req.session_id, {}) if req.session_id else {}
-    info = extract_query_info(req.question, previous_context=context)
+    return await session_store.get(req.session_id) if req.session_id else {}
+
+@app.post("/ask")
+async def ask_question(req: QueryRequest, request: Request = None):
+    started = time.perf_counter()
+    context = await load_context(req)
+    # Recognizable questions are parsed locally; only the rest pay for an LLM call
+    with span("fast_path", "unknown"):
+        info = await fast_extract(req.question, previous_context=context)
+    if info is None:
+        info = await extraction_cache.get_or_compute(
+            cache_key(req.question, context),
+            lambda: extract_with_router(req.question, context),
+        )
+    response = await respond(req, context, info, Lookups(), stream=req.stream, request=request)
+    observe("request", time.perf_counter() - started, current_intent.get())
+    return response
+
+@app.post("/ask/batch")
+async def ask_batch(reqs: List[QueryRequest]):
+    results = [None] * len(reqs)
+    lookups = Lookups()
+    # Items sharing a session go into successive rounds, in order, so a follow-up
+    # sees the context left by the question before it
+    rounds = []
+    session_rounds = {}
+    for index, req in enumerate(reqs):
+        round_no = session_rounds.get(req.session_id, 0) if req.session_id else 0
+        if req.session_id:
+            session_rounds[req.session_id] = round_no + 1
+        if round_no == len(rounds):
+            rounds.append([])
+        rounds[round_no].append(index)
+    for indexes in rounds:
+        await answer_round(reqs, indexes, results, lookups)
+    return {"results": results}
+
+async def answer_round(reqs, indexes, results, lookups):
+    # A failure for one item becomes that item's {"error": ...}; the rest still get answers
+    errors = {}
+    loaded = await asyncio.gather(*(load_context(reqs[i]) for i in indexes), return_exceptions=True)
+    contexts = {}
+    for i, context in zip(indexes, loaded):
+        if isinstance(context, Exception):
+            errors[i] = context
+        else:
+            contexts[i] = context
+    # Refresh the brand dictionary once for the round rather than once per item
+    await load_brands()
+    parsed = await asyncio.gather(
+        *(fast_extract(reqs[i].question, previous_context=contexts[i]) for i in contexts),
+        return_exceptions=True,
+    )
+    infos = {}
+    # Items asking the same question in the same context share one LLM extraction
+    pending = {}
+    for i, info in zip(list(contexts), parsed):
+        if isinstance(info, Exception):
+            errors[i] = info
+            continue
+        if info is None:
+            key = cache_key(reqs[i].question, contexts[i])
+            info = extraction_cache.lookup(key)
+            if info is None:
+                pending.setdefault(key, []).append(i)
+                continue
+        infos[i] = info
+
+    # Pack the remaining questions into as few extraction prompts as possible
+    keys = list(pending)
+    chunks = [keys[n:n + BATCH_LLM_SIZE] for n in range(0, len(keys), BATCH_LLM_SIZE)]
+    batches = await asyncio.gather(
+        *(extract_batch([reqs[pending[key][0]].question for key in chunk], [contexts[pending[key][0]] for key in chunk]) for chunk in chunks),
+        return_exceptions=True,
+    )
+    retry = []
+    for chunk, batch in zip(chunks, batches):
+        for position, key in enumerate(chunk):
+            info = None if isinstance(batch, Exception) else batch[position]
+            if isinstance(info, dict):
+                extraction_cache.put(key, copy.deepcopy(info))
+                for i in pending[key]:
+                    infos[i] = info if i == pending[key][0] else copy.deepcopy(info)
+            else:
+                retry.extend(pending[key])
+
+    async def extract_one(i):
+        # Items the batch prompt could not answer get the regular single-question path
+        if i in retry:
+            infos[i] = await extraction_cache.get_or_compute(
+                cache_key(reqs[i].question, contexts[i]),
+                lambda: extract_with_router(reqs[i].question, contexts[i]),
+            )
+        return await respond(reqs[i], contexts[i], infos[i], lookups)
+
+    answered = [i for i in indexes if i not in errors]
+    answers = await asyncio.gather(*(extract_one(i) for i in answered), return_exceptions=True)
+    for i, answer in zip(answered, answers):
+        if isinstance(answer, Exception):
+            errors[i] = answer
+        else:
+            results[i] = answer
+    for i, error in errors.items():
+        logger.warning("batch item %s failed: %r", i, error)
+        results[i] = {"error": str(error) or error.__class__.__name__}
+
+def frame(chunk, stream):
+    data = json.dumps(chunk)
+    return f"data: {data}\n\n" if stream == "sse" else data + "\n"
+
+async def stream_chunks(info, stream, request=None):
+    # StreamingResponse only pulls the next chunk once the previous one is sent, so a
+    # slow client stops the cursor from fetching further batches (backpressure)
+    brand, intent, size = info.get("brand"), info.get("intent"), info.get("size")
+    source = stream_models_and_sizes(brand if intent == "list_sizes" else None, size)
+    count = 0
+    types = set()
+    try:
+        async for item in source:
+            if intent == "models_and_types_by_size":
+                if item["type"]:
+                    types.add(item["type"])
+                item = {"model": item["model"], "brand": item["brand"]}
+            elif size:
+                item.pop("type")
+            elif not item["sizes"]:
+                continue
+            count += 1
+            yield frame(item, stream)
+            if request is not None and count % mongo_utils.STREAM_BATCH_SIZE == 0 and await request.is_disconnected():
+                return
+    finally:
+        await source.aclose()
+    if types:
+        yield frame({"types": sorted(types)}, stream)
+    if count == 0:
+        if intent == "models_and_types_by_size":
+            message = f"No models or types found for size {size}."
+        else:
+            message = f"No sizes found for {brand or 'the specified brand'}."
+        yield frame({"message": message}, stream)
+    yield frame({"done": True, "count": count}, stream)
+
+async def respond(req, context, info, lookups, stream=None, request=None):
     if not info:
         return {"message": "Sorry, I couldn't understand your request."}
 
@@ -30,15 +277,28 @@ async def ask_question(req: QueryRequest):
             info[key] = context[key]
     # Save updated context
     if req.session_id:
-        session_context[req.session_id] = updated_context
+        await session_store.set(req.session_id, updated_context)
+
+    current_intent.set(info.get("intent") or "get_sales")
+    if stream and info.get("intent") in STREAMABLE_INTENTS:
+        return StreamingResponse(stream_chunks(info, stream, request), media_type=STREAM_MEDIA_TYPES[stream])
+
+    # Formatting time is the response time minus what was spent waiting on lookups
+    waits = Waits()
+    current_waits.set(waits)
+    started = time.perf_counter()
+    response = await answer_intent(req, info, lookups)
+    observe("format", max(0.0, time.perf_counter() - started - waits.total))
+    return response
 
+async def answer_intent(req, info, lookups):
     brand = info.get("brand")
     intent = info.get("intent")
     size = info.get("size")
 
     # Handle different intents
     if intent == "get_type_by_size":
-        result = get_type_by_size(size)
+        result = await lookups.call(get_type_by_size, size)
         if result.get("types"):
             types_str = ", ".join(result["types"])
             return {"message": f"The type(s) of tyre used for size {result['size']} is/are: {types_str}."}
@@ -46,7 +306,7 @@ async def ask_question(req: QueryRequest):
             return {"message": result.get("message", "Could not determine the tyre type for this size.")}
 
     elif intent == "list_models":
-        result = get_models_and_sizes(brand, intent)
+        result = await lookups.call(get_models_and_sizes, brand, intent)
         if result.get("models"):
             models_str = ", ".join(result["models"])
             return {"message": f"Models available for {result.get('brand', 'the specified brand')}: {models_str}."}
@@ -54,7 +314,7 @@ async def ask_question(req: QueryRequest):
             return {"message": f"No models found for the brand {result.get('brand', 'specified')}. "}
 
     elif intent == "list_sizes":
-        result = get_models_and_sizes(brand, intent, size)
+        result = await lookups.call(get_models_and_sizes, brand, intent, size)
         if result.get("model_sizes"):
             response_parts = []
             for item in result["model_sizes"]:
@@ -73,7 +333,7 @@ async def ask_question(req: QueryRequest):
             return {"message": f"No sizes found for {result.get('brand', 'the specified brand')}. "}
 
     elif intent == "count_type_by_size":
-        result = get_type_by_size(size)
+        result = await lookups.call(get_type_by_size, size)
         if result.get("types"):
             count = len(result["types"])
             return {"message": f"There {'is' if count == 1 else 'are'} {count} type{'s' if count != 1 else ''} of tyre used for size {result['size']} in the inventory."}
@@ -81,10 +341,11 @@ async def ask_question(req: QueryRequest):
             return {"message": result.get("message", "Could not determine the tyre type count for this size.")}
 
     elif intent == "models_and_types_by_size":
-        # Get models for the size
-        models_result = get_models_and_sizes(None, "list_sizes", size)
-        # Get types for the size
-        types_result = get_type_by_size(size)
+        # Get models and types for the size concurrently
+        models_result, types_result = await asyncio.gather(
+            lookups.call(get_models_and_sizes, None, "list_sizes", size),
+            lookups.call(get_type_by_size, size),
+        )
         models = []
         if models_result.get("tyres"):
             models = [f"{t['brand']} {t['model']}" for t in models_result["tyres"]]
@@ -100,27 +361,22 @@ async def ask_question(req: QueryRequest):
             return {"message": f"No models or types found for size {size}."}
 
     elif intent == "tubeless_sizes_by_brand":
-        # Find all tyres for the brand with type 'tubeless'
-        query = {"type": {"$regex": "tubeless", "$options": "i"}}
-        if brand:
-            query["brand"] = {"$regex": brand, "$options": "i"}
-        tyres = list(db.addtyres.find(query))
-        sizes = set()
-        for tyre in tyres:
-            for stock_item in tyre.get("stock", []):
-                if stock_item.get("size"):
-                    sizes.add(stock_item["size"])
-        count = len(tyres)
+        result = await lookups.call(get_tubeless_sizes, brand)
+        count = result["count"]
         if count > 0:
-            return {"message": f"There are {count} tubeless tyres for {brand}. Sizes: {', '.join(sorted(sizes))}."}
+            return {"message": f"There are {count} tubeless tyres for {brand}. Sizes: {', '.join(result['sizes'])}."}
         else:
             return {"message": f"No tubeless tyres found for {brand}."}
 
     # Default to sales logic if intent is not recognized or is get_sales
     else:
         product = brand # assuming brand is the product for sales query
-        date_range = info.get("date_range")
-        result = get_sales(product, date_range)
+        date_range = info.get("date_range") or find_date_phrase(req.question)
+        if date_range and parse_date_range(date_range) is None and not means_all_time(date_range):
+            # Better than answering with all-time totals for a period the user did name
+            return {"message": f"Sorry, I couldn't understand the period \"{date_range}\". "
+                               "Try something like \"last 3 months\", \"Q2 2024\" or \"2024-01-15 to 2024-02-15\"."}
+        result = await lookups.call(get_sales, product, date_range)
         if result["total_orders"] > 0:
             # Format message based on sales results
             message_parts = []
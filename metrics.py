@@ -0,0 +1,160 @@
+import os
+import time
+import random
+import bisect
+import cProfile
+import logging
+import threading
+from contextvars import ContextVar
+
+# Per-stage latency histograms, tagged by intent, rendered in Prometheus text format.
+
+logger = logging.getLogger(__name__)
+
+BUCKETS = (0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+LLM_LOG_SAMPLE_RATE = float(os.getenv("LLM_LOG_SAMPLE_RATE", "0.01"))
+# "1" profiles every request, "header" only those sent with "X-Profile: 1"
+PROFILE_REQUESTS = os.getenv("PROFILE_REQUESTS", "0")
+PROFILE_DIR = os.getenv("PROFILE_DIR", "profiles")
+
+# Intent of the request being served; Mongo spans pick it up without it being passed down
+current_intent = ContextVar("current_intent", default="unknown")
+# Time the current response spent waiting on lookups, so formatting can be timed apart
+current_waits = ContextVar("current_waits", default=None)
+
+histograms = {}  # (stage, intent) -> [bucket counts..., +Inf count, sum]
+counters = {}
+
+
+class Span:
+    __slots__ = ("stage", "intent", "started")
+
+    def __init__(self, stage, intent=None):
+        self.stage = stage
+        self.intent = intent
+
+    def __enter__(self):
+        self.started = time.perf_counter()
+        return self
+
+    def __exit__(self, *exc):
+        observe(self.stage, time.perf_counter() - self.started, self.intent)
+        return False
+
+
+def span(stage, intent=None):
+    return Span(stage, intent)
+
+
+def observe(stage, seconds, intent=None):
+    key = (stage, intent or current_intent.get())
+    histogram = histograms.get(key)
+    if histogram is None:
+        histogram = histograms[key] = [0] * (len(BUCKETS) + 2)
+    histogram[bisect.bisect_left(BUCKETS, seconds)] += 1
+    histogram[-1] += seconds
+
+
+def increment(name, amount=1):
+    counters[name] = counters.get(name, 0) + amount
+
+
+def sample_llm_output(content):
+    # A sampled log line instead of printing every raw completion
+    if LLM_LOG_SAMPLE_RATE and random.random() < LLM_LOG_SAMPLE_RATE:
+        logger.info("llm raw response: %s", content)
+
+
+class Waits:
+    # Union of the intervals spent awaiting lookups, so overlapping waits count once
+    __slots__ = ("total", "active", "since")
+
+    def __init__(self):
+        self.total = 0.0
+        self.active = 0
+        self.since = 0.0
+
+
+async def waiting(awaitable):
+    waits = current_waits.get()
+    if waits is None:
+        return await awaitable
+    if waits.active == 0:
+        waits.since = time.perf_counter()
+    waits.active += 1
+    try:
+        return await awaitable
+    finally:
+        waits.active -= 1
+        if waits.active == 0:
+            waits.total += time.perf_counter() - waits.since
+
+
+def label_value(value):
+    return str(value).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
+
+def render(gauges=None):
+    lines = [
+        "# HELP chatbot_stage_seconds Latency of /ask pipeline stages by intent.",
+        "# TYPE chatbot_stage_seconds histogram",
+    ]
+    for (stage, intent), histogram in sorted(histograms.items()):
+        labels = f'stage="{label_value(stage)}",intent="{label_value(intent)}"'
+        cumulative = 0
+        for bound, count in zip(BUCKETS, histogram):
+            cumulative += count
+            lines.append(f'chatbot_stage_seconds_bucket{{{labels},le="{bound}"}} {cumulative}')
+        cumulative += histogram[len(BUCKETS)]
+        lines.append(f'chatbot_stage_seconds_bucket{{{labels},le="+Inf"}} {cumulative}')
+        lines.append(f"chatbot_stage_seconds_sum{{{labels}}} {histogram[-1]}")
+        lines.append(f"chatbot_stage_seconds_count{{{labels}}} {cumulative}")
+    for name, value in sorted(counters.items()):
+        lines.append(f"# TYPE chatbot_{name}_total counter")
+        lines.append(f"chatbot_{name}_total {value}")
+    # Component stats (parser, caches, catalog, sessions) flattened into gauges
+    for section, values in sorted((gauges or {}).items()):
+        for key, value in sorted(values.items()):
+            if isinstance(value, bool):
+                value = int(value)
+            if isinstance(value, (int, float)):
+                lines.append(f"chatbot_{section}_{key} {value}")
+    return "\n".join(lines) + "\n"
+
+
+def should_profile(request):
+    if PROFILE_REQUESTS == "1":
+        return True
+    return PROFILE_REQUESTS == "header" and request.headers.get("x-profile") == "1"
+
+
+# Only one cProfile profiler can be active at a time (3.12+ refuses a second one,
+# older versions silently replace the first one's hook)
+profile_lock = threading.Lock()
+
+
+async def profile_request(request, call_next):
+    # Requests arriving while another is being profiled are served unprofiled. The
+    # profile still covers the whole thread, so requests running alongside show up
+    # in it; profile under light load. View with snakeviz or flameprof.
+    if not profile_lock.acquire(blocking=False):
+        increment("profiles_skipped")
+        return await call_next(request)
+    try:
+        profiler = cProfile.Profile()
+        try:
+            profiler.enable()
+        except ValueError:
+            # A profiler started outside this module (e.g. the process runs under one)
+            increment("profiles_skipped")
+            return await call_next(request)
+        try:
+            return await call_next(request)
+        finally:
+            profiler.disable()
+            os.makedirs(PROFILE_DIR, exist_ok=True)
+            path = request.url.path.replace("/", "_")
+            name = f"{time.strftime('%Y%m%d-%H%M%S')}-{time.perf_counter_ns() % 10**6:06d}{path}.prof"
+            profiler.dump_stats(os.path.join(PROFILE_DIR, name))
+    finally:
+        profile_lock.release()
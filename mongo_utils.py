@@ -1,60 +1,111 @@
-from pymongo import MongoClient
+from pymongo import AsyncMongoClient
 import os
+import asyncio
 from dotenv import load_dotenv
-from datetime import datetime
+from date_ranges import parse_date_range
+from metrics import span
 import json
 import re
 
 load_dotenv()
-client = MongoClient(os.getenv("MONGO_URI"))
+client = AsyncMongoClient(os.getenv("MONGO_URI"))
 db = client[os.getenv("MONGO_DB_NAME", "tyres")]
 
-def get_sales(product, date_range):
-    # 1. Find all tyres matching the product (brand/name)
+# Upper bound on concurrent queries per worker, kept below the driver pool size
+mongo_semaphore = asyncio.Semaphore(int(os.getenv("MONGO_MAX_CONCURRENCY", "32")))
+# Documents per cursor round-trip when streaming large results
+STREAM_BATCH_SIZE = int(os.getenv("STREAM_BATCH_SIZE", "100"))
+
+async def find_all(collection, query, projection=None):
+    async with mongo_semaphore:
+        with span(f"mongo:{collection.name}.find"):
+            return await collection.find(query, projection).to_list()
+
+async def aggregate_all(collection, pipeline):
+    async with mongo_semaphore:
+        with span(f"mongo:{collection.name}.aggregate"):
+            cursor = await collection.aggregate(pipeline)
+            return await cursor.to_list()
+
+def sales_pipeline(order_query, tyre_ids):
+    return [
+        {"$match": order_query},
+        {"$facet": {
+            "orders": [{"$count": "count"}],
+            "by_tyre": [
+                {"$project": {"orderItems.tyre": 1, "orderItems.quantity": 1, "orderItems.totalPrice": 1}},
+                {"$unwind": "$orderItems"},
+                {"$match": {"orderItems.tyre": {"$in": tyre_ids}}},
+                {"$group": {
+                    "_id": "$orderItems.tyre",
+                    "quantity": {"$sum": "$orderItems.quantity"},
+                    "sales": {"$sum": "$orderItems.totalPrice"},
+                }},
+            ],
+        }},
+    ]
+
+async def find_sales_tyres(product):
+    # Find all tyres matching the product (brand/name)
     tyre_query = {}
     if product:
         tyre_query["brand"] = {"$regex": product, "$options": "i"}
-    tyre_docs = list(db.addtyres.find(tyre_query))
-    tyre_ids = [tyre["_id"] for tyre in tyre_docs]
+    return await find_all(db.addtyres, tyre_query, {"brand": 1, "model": 1})
 
-    # 2. Build order query for clientorders (search in orderItems.tyre)
+async def raw_sales_totals(tyre_ids, start=None, end=None):
+    # Order count and per-tyre (quantity, sales) over raw clientorders in [start, end)
     order_query = {}
     if tyre_ids:
         order_query["orderItems.tyre"] = {"$in": tyre_ids}
-    if date_range and "last year" in date_range.lower():
-        now = datetime.now()
-        last_year = now.year - 1
-        start = datetime(last_year, 1, 1)
-        end = datetime(last_year, 12, 31, 23, 59, 59)
-        order_query["createdAt"] = {"$gte": start, "$lte": end}
-
-    # 3. Find matching orders
-    orders = list(db.clientorders.find(order_query))
-
-    # 4. Aggregate sales (sum quantity and totalPrice for matching orderItems)
-    total_quantity = 0
-    total_sales = 0
-    for order in orders:
-        for item in order.get("orderItems", []):
-            if item.get("tyre") in tyre_ids:
-                total_quantity += item.get("quantity", 0)
-                total_sales += item.get("totalPrice", 0)
+    if start is not None or end is not None:
+        order_query["createdAt"] = {}
+        if start is not None:
+            order_query["createdAt"]["$gte"] = start
+        if end is not None:
+            order_query["createdAt"]["$lt"] = end
+
+    # Count orders and sum matching orderItems server-side; only totals come back
+    facets = (await aggregate_all(db.clientorders, sales_pipeline(order_query, tyre_ids)))[0]
+    orders = facets["orders"][0]["count"] if facets["orders"] else 0
+    return orders, {row["_id"]: (row["quantity"], row["sales"]) for row in facets["by_tyre"]}
+
+def sales_result(tyre_docs, orders, totals, period):
+    tyres_by_id = {tyre["_id"]: tyre for tyre in tyre_docs}
+    by_tyre = []
+    for tyre_id, (quantity, sales) in totals.items():
+        tyre = tyres_by_id.get(tyre_id, {})
+        by_tyre.append({
+            "tyre": tyre_id,
+            "brand": tyre.get("brand"),
+            "model": tyre.get("model"),
+            "quantity": quantity,
+            "sales": sales,
+        })
 
     tyre_names = [tyre.get("brand", str(tyre["_id"])) for tyre in tyre_docs]
 
     return {
         "tyre_names": tyre_names,
-        "total_orders": len(orders),
-        "total_quantity": total_quantity,
-        "total_sales": total_sales,
-        "orders": orders  # or summarize as needed
+        "total_orders": orders,
+        "total_quantity": sum(row["quantity"] for row in by_tyre),
+        "total_sales": sum(row["sales"] for row in by_tyre),
+        "by_tyre": by_tyre,
+        "period": period,
     }
 
-def get_models_and_sizes(brand, intent, size=None):
+async def get_sales(product, date_range):
+    # Straight from clientorders; sales_rollup.get_sales answers from daily rollups instead
+    tyre_docs = await find_sales_tyres(product)
+    period = parse_date_range(date_range)
+    start, end = period or (None, None)
+    orders, totals = await raw_sales_totals([tyre["_id"] for tyre in tyre_docs], start, end)
+    return sales_result(tyre_docs, orders, totals, period)
+
+async def get_models_and_sizes(brand, intent, size=None):
     query = {}
     if brand:
         query["brand"] = {"$regex": brand, "$options": "i"}
-    tyres = list(db.addtyres.find(query))
+    tyres = await find_all(db.addtyres, query, {"brand": 1, "model": 1, "stock.size": 1})
     if intent == "list_models":
         models = [tyre.get("model") for tyre in tyres]
         return {"models": models, "brand": brand}
@@ -85,13 +136,13 @@ def get_models_and_sizes(brand, intent, size=None):
     else:
         return {"message": "Intent not recognized or not supported."}
 
-def get_type_by_size(size):
+async def get_type_by_size(size):
     if not size:
         return {"message": "Please specify a tyre size."}
 
     # Find tyres that have the specified size in their stock array
     query = {"stock.size": size}
-    tyres = list(db.addtyres.find(query))
+    tyres = await find_all(db.addtyres, query, {"type": 1})
 
     if not tyres:
         return {"message": f"No tyres found with size {size}."}
@@ -102,4 +153,60 @@ def get_type_by_size(size):
     if not tyre_types:
         return {"message": f"Found tyres with size {size}, but their type is not specified."}
 
-    return {"size": size, "types": tyre_types} 
\ No newline at end of file
+    return {"size": size, "types": tyre_types}
+
+async def iter_docs(collection, query, projection=None, batch_size=None):
+    # Streams are long-lived, so they are bounded by the driver pool rather than
+    # holding a mongo_semaphore slot while a slow client reads
+    cursor = collection.find(query, projection, batch_size=batch_size or STREAM_BATCH_SIZE)
+    try:
+        # Covers the whole stream, including time spent waiting on the client
+        with span(f"mongo:{collection.name}.stream"):
+            async for doc in cursor:
+                yield doc
+    finally:
+        await cursor.close()
+
+async def stream_models_and_sizes(brand, size=None, batch_size=None):
+    # Lazy counterpart of get_models_and_sizes(brand, "list_sizes", size)
+    query = {}
+    if brand:
+        query["brand"] = {"$regex": brand, "$options": "i"}
+    if size:
+        query["stock.size"] = size
+    async for tyre in iter_docs(db.addtyres, query, {"brand": 1, "model": 1, "type": 1, "stock.size": 1}, batch_size):
+        sizes = [stock_item.get("size") for stock_item in tyre.get("stock", []) if stock_item.get("size")]
+        if size:
+            for tyre_size in sizes:
+                if tyre_size == size:
+                    yield {"model": tyre.get("model"), "brand": tyre.get("brand"), "type": tyre.get("type"), "size": size}
+        else:
+            yield {"model": tyre.get("model"), "brand": tyre.get("brand"), "sizes": sizes}
+
+async def get_tubeless_sizes(brand):
+    # Find all tyres for the brand with type 'tubeless'
+    query = {"type": {"$regex": "tubeless", "$options": "i"}}
+    if brand:
+        query["brand"] = {"$regex": brand, "$options": "i"}
+    tyres = await find_all(db.addtyres, query, {"stock.size": 1})
+    sizes = set()
+    for tyre in tyres:
+        for stock_item in tyre.get("stock", []):
+            if stock_item.get("size"):
+                sizes.add(stock_item["size"])
+    return {"count": len(tyres), "sizes": sorted(sizes)}
+
+async def get_brands():
+    async with mongo_semaphore:
+        with span("mongo:addtyres.distinct"):
+            return await db.addtyres.distinct("brand")
+
+async def ensure_indexes():
+    # Support the $match stages above; the brand regex is unanchored and cannot use an index
+    await db.clientorders.create_index([("orderItems.tyre", 1), ("createdAt", 1)])
+    await db.clientorders.create_index("createdAt")
+    await db.addtyres.create_index("stock.size")
+    # Incremental sales rollup refresh looks for orders changed since its high-water mark
+    await db.clientorders.create_index("updatedAt")
+    await db.sales_daily.create_index([("d", 1), ("t", 1)])
+    await db.sales_daily.create_index([("d", 1), ("b", 1)])
@@ -0,0 +1,198 @@
+import os
+import re
+import time
+
+from catalog import get_brands
+from date_ranges import find_date_phrase, parse_date_range
+from query_schema import SIZE_PATTERN, normalize_size
+
+# Rule-based extractor that answers recognizable questions without an LLM round-trip.
+# Returns the same brand/intent/size dict as llama_processor.extract_query_info.
+
+MIN_CONFIDENCE = float(os.getenv("FAST_PATH_MIN_CONFIDENCE", "0.8"))
+BRAND_REFRESH_SECONDS = float(os.getenv("BRAND_REFRESH_SECONDS", "300"))
+
+
+COUNT_PATTERN = re.compile(r"type count|number of types|how many types")
+MODELS_PATTERN = re.compile(r"\bmodels?\b")
+SIZES_PATTERN = re.compile(r"\bsizes?\b")
+TYPE_PATTERN = re.compile(r"\b(types?|kind)\b")
+SALES_PATTERN = re.compile(r"\b(sales|sold|sell|revenue|orders?)\b")
+
+# Slots each intent needs before it can be answered; any one slot of a group will do
+REQUIRED_SLOTS = {
+    "count_type_by_size": [("size",)],
+    "models_and_types_by_size": [("size",)],
+    "tubeless_sizes_by_brand": [("brand",)],
+    "get_sales": [],
+    "get_type_by_size": [("size",)],
+    "list_sizes": [("brand", "size")],
+    "list_models": [("brand",)],
+}
+
+# Keyword families each intent's own wording may contain; a question that also
+# matches another family ("what sizes can I order") is ambiguous
+KEYWORD_PATTERNS = {
+    "count": COUNT_PATTERN,
+    "tubeless": re.compile(r"\btubeless\b"),
+    "sales": SALES_PATTERN,
+    "models": MODELS_PATTERN,
+    "types": TYPE_PATTERN,
+    "sizes": SIZES_PATTERN,
+}
+INTENT_KEYWORDS = {
+    "count_type_by_size": {"count", "types", "sizes"},
+    "tubeless_sizes_by_brand": {"tubeless", "sizes"},
+    "get_sales": {"sales"},
+    "models_and_types_by_size": {"models", "types", "sizes"},
+    "get_type_by_size": {"types", "sizes", "tubeless"},
+    "list_sizes": {"sizes"},
+    "list_models": {"models"},
+}
+# Slots each intent's answer depends on; a parsed slot the intent would ignore means
+# the question asked for something the rules did not capture
+USED_SLOTS = {
+    "count_type_by_size": {"size"},
+    "models_and_types_by_size": {"size"},
+    "tubeless_sizes_by_brand": {"brand"},
+    "get_sales": {"brand"},
+    "get_type_by_size": {"size"},
+    "list_sizes": {"brand", "size"},
+    "list_models": {"brand"},
+}
+# Below MIN_CONFIDENCE by default, so these go to the LLM
+AMBIGUOUS_CONFIDENCE = 0.6
+# Words that introduce a period in a sales question ("during the festive season"),
+# with the first word after them
+PERIOD_CUE_PATTERN = re.compile(
+    r"\b(?:in|during|for|on|this|since|last|past|next|over|from|between|until|till)\s+(?:(?:the|a|an)\s+)?([\w/-]+)"
+)
+# Words that may follow a cue without naming a period
+NON_PERIOD_WORDS = {"all", "every", "each", "total", "overall", "tyres", "tires", "us"}
+
+stats = {"fast_path_hits": 0, "llm_fallbacks": 0}
+
+_brands = {"pattern": None, "names": {}, "loaded_at": 0.0}
+
+
+def find_size(question):
+    match = SIZE_PATTERN.search(question)
+    return normalize_size(match) if match else None
+
+
+async def load_brands(force=False):
+    if not force and time.monotonic() - _brands["loaded_at"] < BRAND_REFRESH_SECONDS:
+        return
+    try:
+        names = await get_brands()
+    except Exception:
+        # Keep serving from the previous dictionary if Mongo is unavailable
+        _brands["loaded_at"] = time.monotonic()
+        return
+    set_brands(names)
+
+
+def set_brands(names):
+    lookup = {name.lower(): name for name in names if isinstance(name, str) and name.strip()}
+    # Longest first so "BF Goodrich" wins over "Goodrich"
+    alternatives = sorted(lookup, key=len, reverse=True)
+    pattern = None
+    if alternatives:
+        pattern = re.compile(r"\b(" + "|".join(re.escape(a) for a in alternatives) + r")\b")
+    _brands.update(pattern=pattern, names=lookup, loaded_at=time.monotonic())
+
+
+def find_brand(q):
+    pattern = _brands["pattern"]
+    if pattern is None:
+        return None
+    match = pattern.search(q)
+    return _brands["names"][match.group(1)] if match else None
+
+
+def classify(q, brand, size):
+    if COUNT_PATTERN.search(q):
+        return "count_type_by_size"
+    if "tubeless" in q and SIZES_PATTERN.search(q):
+        return "tubeless_sizes_by_brand"
+    if SALES_PATTERN.search(q):
+        return "get_sales"
+    if MODELS_PATTERN.search(q) and size and not brand:
+        return "models_and_types_by_size"
+    if TYPE_PATTERN.search(q) and size:
+        return "get_type_by_size"
+    if SIZES_PATTERN.search(q):
+        return "list_sizes"
+    if MODELS_PATTERN.search(q):
+        return "list_models"
+    return None
+
+
+def unread_period(q, date_range):
+    # True when a sales question names a period the date parser would not fully cover:
+    # "for diwali", "this fortnight", or "2024" read out of "the first quarter of 2024"
+    if date_range and parse_date_range(date_range) is None:
+        return True
+    start = q.find(date_range.lower()) if date_range else -1
+    end = start + len(date_range) if start >= 0 else -1
+    for match in PERIOD_CUE_PATTERN.finditer(q):
+        word_start = match.start(1)
+        if start <= word_start < end or match.group(1) in NON_PERIOD_WORDS:
+            continue
+        if find_brand(q[word_start:]) and _brands["pattern"].match(q, word_start):
+            continue
+        return True
+    return False
+
+
+def parse_query(user_question, previous_context=None):
+    q = user_question.lower()
+    size = find_size(user_question)
+    brand = find_brand(q)
+    intent = classify(q, brand, size)
+    info = {"brand": brand, "intent": intent, "size": size}
+    date_range = find_date_phrase(user_question)
+    if date_range:
+        info["date_range"] = date_range
+
+    if intent is None:
+        info["confidence"] = 0.0
+        return info
+
+    confidence = 0.95
+    keywords = {name for name, pattern in KEYWORD_PATTERNS.items() if pattern.search(q)}
+    if keywords - INTENT_KEYWORDS[intent]:
+        confidence = AMBIGUOUS_CONFIDENCE
+    if any(info.get(slot) for slot in ("brand", "size") if slot not in USED_SLOTS[intent]):
+        confidence = AMBIGUOUS_CONFIDENCE
+    if intent == "get_sales" and unread_period(q, date_range):
+        confidence = AMBIGUOUS_CONFIDENCE
+    context = previous_context or {}
+    for group in REQUIRED_SLOTS[intent]:
+        if any(info.get(slot) for slot in group):
+            continue
+        filled = [slot for slot in group if context.get(slot)]
+        if filled:
+            # Follow-up such as "and its sizes?" could also name something outside
+            # the brand dictionary, so leave the final call to the LLM by default
+            info[filled[0]] = context[filled[0]]
+            confidence = min(confidence, 0.7)
+        else:
+            confidence = 0.5
+    info["confidence"] = confidence
+    return info
+
+
+async def fast_extract(user_question, previous_context=None):
+    await load_brands()
+    info = parse_query(user_question, previous_context)
+    if info.pop("confidence") < MIN_CONFIDENCE:
+        stats["llm_fallbacks"] += 1
+        return None
+    stats["fast_path_hits"] += 1
+    return info
+
+
+def parser_stats():
+    total = stats["fast_path_hits"] + stats["llm_fallbacks"]
+    return {**stats, "hit_rate": stats["fast_path_hits"] / total if total else 0.0}
@@ -0,0 +1,111 @@
+import re
+import json
+
+from metrics import span
+
+# Prompt, JSON parsing and output schema shared by every LLM provider, so each
+# extract_query_info returns the same brand/intent/size/date_range dict.
+
+INTENTS = (
+    "list_models",
+    "list_sizes",
+    "get_type_by_size",
+    "get_sales",
+    "count_type_by_size",
+    "models_and_types_by_size",
+    "tubeless_sizes_by_brand",
+)
+FIELDS = ("brand", "intent", "size", "date_range")
+
+# 195/65R15, 195/65 r15, 205/55ZR16
+SIZE_PATTERN = re.compile(r"\b(\d{3})\s*/\s*(\d{2})\s*(z?r)\s*(\d{2})\b", re.IGNORECASE)
+
+FIELDS_PROMPT = """
+    - brand (e.g., MRF, Michelin)
+    - intent: "list_models" if the user wants to know all models for a brand, "list_sizes" if the user wants to know sizes for a brand/model, "get_type_by_size" if the user wants to know the type of a tyre for a specific size, or "get_sales" for sales-related questions.
+    - size (if mentioned, e.g., 195/65R15)
+    - date_range (for sales questions, the period as written, e.g., last year, Q1 2024, last 30 days)"""
+
+
+def normalize_size(match):
+    width, ratio, construction, rim = match.groups()
+    return f"{width}/{ratio}{construction.upper()}{rim}"
+
+
+def single_prompt(user_question):
+    return f"""
+    For a tyre management system database, extract the following from the user question:{FIELDS_PROMPT}
+    Return ONLY valid JSON with keys: brand, intent, size, date_range. Do not include any explanation or text before or after the JSON.
+    User question: {user_question}
+    """
+
+
+def batch_prompt(user_questions):
+    numbered = "\n".join(f"    {i}. {q}" for i, q in enumerate(user_questions))
+    return f"""
+    For a tyre management system database, extract the following from each numbered user question:{FIELDS_PROMPT}
+    Return ONLY a valid JSON array with one object per question, each with keys: id (the question number), brand, intent, size, date_range. Do not include any explanation or text before or after the JSON.
+    Questions:
+{numbered}
+    """
+
+
+def parse_json_content(content):
+    with span("json_parse"):
+        # Extract JSON from code block if present
+        if content and "```" in content:
+            json_str = content.split("```", 1)[1]
+            if json_str.startswith("json"):
+                json_str = json_str[4:]
+            json_str = json_str.strip(" \n`")
+        else:
+            json_str = content
+        return json.loads(json_str)
+
+
+def normalize_info(info):
+    # Same keys from every provider; blanks, "null" strings and anything that is not a
+    # string (a {"start", "end"} date_range, a list of brands) become None
+    if not isinstance(info, dict):
+        return None
+    normalized = {}
+    for key in FIELDS:
+        value = info.get(key)
+        if isinstance(value, str):
+            value = value.strip()
+            if not value or value.lower() in ("null", "none", "n/a"):
+                value = None
+        else:
+            value = None
+        normalized[key] = value
+    if isinstance(normalized["size"], str):
+        normalized["size"] = SIZE_PATTERN.sub(normalize_size, normalized["size"])
+    if normalized["intent"] not in INTENTS:
+        # main.py answers unknown intents as sales questions
+        normalized["intent"] = "get_sales" if normalized["intent"] else None
+    return normalized
+
+
+def post_process(info, user_question, previous_context=None):
+    # Add post-processing for count intent
+    if isinstance(info, dict):
+        q = user_question.lower()
+        if re.search(r"(type count|number of types|how many types)", q):
+            info["intent"] = "count_type_by_size"
+        # Detect queries for models for a specific size
+        elif re.search(r"models? (available|for|with)? ?(size)? ?[0-9]+/[0-9]+r[0-9]+", q):
+            info["intent"] = "models_and_types_by_size"
+        # Detect queries for tubeless and their sizes for a brand
+        elif re.search(r"tubeless.*sizes?", q) or ("tubeless" in q and "size" in q):
+            info["intent"] = "tubeless_sizes_by_brand"
+        # Fill missing fields from previous_context
+        if previous_context:
+            for key in ["brand", "size"]:
+                if (key not in info or info[key] is None) and previous_context.get(key):
+                    info[key] = previous_context[key]
+    return info
+
+
+def parse_response(content, user_question, previous_context=None):
+    # Raises on malformed JSON; None when the JSON is not an object
+    return post_process(normalize_info(parse_json_content(content)), user_question, previous_context)
@@ -0,0 +1,393 @@
+import os
+import sys
+import math
+import time
+import socket
+import asyncio
+import logging
+import argparse
+from datetime import datetime, timedelta, timezone
+
+from pymongo.errors import DuplicateKeyError, PyMongoError
+
+import mongo_utils
+from date_ranges import parse_date_range
+from metrics import span
+
+# Daily sales rollups in db.sales_daily, maintained with $merge from db.clientorders, so
+# sales questions read a few documents per day instead of every order in the period.
+#
+# Two kinds of documents share the collection, both keyed by UTC day "YYYY-MM-DD":
+#   {d, t, quantity, sales}  totals per tyre, additive across tyres and days
+#   {d, b, orders}           orders per distinct sorted set of brands in the order, so
+#                            "orders containing any tyre of these brands" is a sum over
+#                            the sets that intersect them
+# Brands are resolved when a day is rolled up; renaming a tyre's brand needs a backfill.
+#
+# db.rollup_state holds the high-water mark of createdAt/updatedAt seen so far and
+# covered_until, the day from which answers fall back to raw orders. Each refresh
+# recomputes whole days touched by orders changed since the mark. Deleted orders and
+# orders moved to another day are only picked up by a backfill.
+
+logger = logging.getLogger(__name__)
+
+STATE_ID = "sales_daily"
+LEASE_ID = "sales_daily_lease"
+REFRESH_SECONDS = float(os.getenv("SALES_ROLLUP_REFRESH_SECONDS", "300"))
+# Workers that only read rollups and pick up state written elsewhere (cron, another worker)
+REFRESH_ENABLED = os.getenv("SALES_ROLLUP_REFRESH", "1") == "1"
+LEASE_SECONDS = float(os.getenv("SALES_ROLLUP_LEASE_SECONDS", "3600"))
+# Days rebuilt per $merge when catching up
+REFRESH_DAY_CHUNK = 100
+
+DAY = {"$dateToString": {"format": "%Y-%m-%d", "date": "$createdAt"}}
+# Brand of a looked-up tyre, "" for a tyre without one, null for items whose tyre is gone
+LOOKUP_BRAND = {"$cond": [
+    {"$eq": [{"$size": "$tyre"}, 0]},
+    None,
+    {"$ifNull": [{"$arrayElemAt": ["$tyre.brand", 0]}, ""]},
+]}
+
+
+def day_key(moment):
+    return moment.strftime("%Y-%m-%d")
+
+
+def floor_day(moment):
+    return moment.replace(hour=0, minute=0, second=0, microsecond=0)
+
+
+def ceil_day(moment):
+    day = floor_day(moment)
+    return day if day == moment else day + timedelta(days=1)
+
+
+def utc_now():
+    # Naive UTC, as pymongo returns stored dates
+    return datetime.now(timezone.utc).replace(tzinfo=None)
+
+
+def day_query(day):
+    if day is None:
+        return {"createdAt": None}
+    start = datetime.strptime(day, "%Y-%m-%d")
+    return {"createdAt": {"$gte": start, "$lt": start + timedelta(days=1)}}
+
+
+def tyre_rollup_pipeline(order_match, version):
+    return [
+        {"$match": order_match},
+        {"$project": {"createdAt": 1, "orderItems.tyre": 1, "orderItems.quantity": 1, "orderItems.totalPrice": 1}},
+        {"$unwind": "$orderItems"},
+        {"$group": {
+            "_id": {"d": DAY, "t": "$orderItems.tyre"},
+            "quantity": {"$sum": "$orderItems.quantity"},
+            "sales": {"$sum": "$orderItems.totalPrice"},
+        }},
+        {"$addFields": {"d": "$_id.d", "t": "$_id.t", "v": version}},
+        {"$merge": {"into": "sales_daily", "on": "_id", "whenMatched": "replace", "whenNotMatched": "insert"}},
+    ]
+
+
+def order_rollup_pipeline(order_match, version):
+    return [
+        {"$match": order_match},
+        {"$project": {"createdAt": 1, "orderItems.tyre": 1}},
+        {"$unwind": {"path": "$orderItems", "preserveNullAndEmptyArrays": True}},
+        {"$lookup": {"from": "addtyres", "localField": "orderItems.tyre", "foreignField": "_id", "as": "tyre"}},
+        # One row per (order, brand), then each order's brands in sorted order
+        {"$group": {"_id": {"o": "$_id", "b": LOOKUP_BRAND}, "d": {"$first": DAY}}},
+        {"$sort": {"_id.b": 1}},
+        {"$group": {"_id": "$_id.o", "d": {"$first": "$d"}, "b": {"$push": "$_id.b"}}},
+        {"$group": {"_id": {"d": "$d", "b": "$b"}, "orders": {"$sum": 1}}},
+        {"$addFields": {"d": "$_id.d", "b": "$_id.b", "v": version}},
+        {"$merge": {"into": "sales_daily", "on": "_id", "whenMatched": "replace", "whenNotMatched": "insert"}},
+    ]
+
+
+async def run_pipeline(collection, pipeline):
+    # Rollup builds can run for minutes, so they do not hold a mongo_semaphore slot
+    with span(f"mongo:{collection.name}.aggregate"):
+        cursor = await collection.aggregate(pipeline, allowDiskUse=True)
+        return await cursor.to_list()
+
+
+class SalesRollups:
+    def __init__(self):
+        self.state = None
+        self.owner = f"{socket.gethostname()}:{os.getpid()}"
+        self.stats = {
+            "refreshes": 0,
+            "days_rebuilt": 0,
+            "last_refresh_seconds": 0.0,
+            "rollup_answers": 0,
+            "mixed_answers": 0,
+            "raw_answers": 0,
+        }
+
+    # -- maintenance --
+
+    async def load(self):
+        self.state = await mongo_utils.db.rollup_state.find_one({"_id": STATE_ID})
+        return self.state
+
+    async def acquire(self):
+        # One builder at a time: concurrent rebuilds of a day would delete each other's rows
+        now = utc_now()
+        try:
+            await mongo_utils.db.rollup_state.find_one_and_update(
+                {"_id": LEASE_ID, "until": {"$lt": now}},
+                {"$set": {"until": now + timedelta(seconds=LEASE_SECONDS), "owner": self.owner}},
+                upsert=True,
+            )
+            return True
+        except DuplicateKeyError:
+            return False
+
+    async def release(self):
+        await mongo_utils.db.rollup_state.delete_one({"_id": LEASE_ID, "owner": self.owner})
+
+    async def rebuild(self, order_match, version, days=None):
+        orders = mongo_utils.db.clientorders
+        await run_pipeline(orders, tyre_rollup_pipeline(order_match, version))
+        await run_pipeline(orders, order_rollup_pipeline(order_match, version))
+        # Rows from the previous build of these days that no longer have orders behind them
+        stale = {"v": {"$ne": version}}
+        if days is not None:
+            stale["d"] = {"$in": days}
+        await mongo_utils.db.sales_daily.delete_many(stale)
+
+    async def save(self, high_water, covered_until):
+        self.state = {"_id": STATE_ID, "high_water": high_water, "covered_until": covered_until, "refreshed_at": utc_now()}
+        await mongo_utils.db.rollup_state.replace_one({"_id": STATE_ID}, self.state, upsert=True)
+
+    async def backfill(self):
+        if not await self.acquire():
+            raise RuntimeError("another process is building the sales rollups")
+        try:
+            started = time.perf_counter()
+            covered_until = floor_day(utc_now())
+            # Taken before the build, so orders written during it are picked up by the next refresh
+            rows = await run_pipeline(mongo_utils.db.clientorders, [
+                {"$group": {"_id": None, "hw": {"$max": {"$max": ["$createdAt", "$updatedAt"]}}}},
+            ])
+            high_water = rows[0]["hw"] if rows else None
+            await self.rebuild({}, time.time_ns())
+            await self.save(high_water, covered_until)
+            self.stats["last_refresh_seconds"] = time.perf_counter() - started
+        finally:
+            await self.release()
+
+    async def refresh(self):
+        # Returns the number of days rebuilt, or None when there is nothing to refresh yet
+        if await self.load() is None or not await self.acquire():
+            return None
+        try:
+            started = time.perf_counter()
+            covered_until = floor_day(utc_now())
+            high_water = self.state["high_water"]
+            changed = {}
+            if high_water is not None:
+                changed = {"$or": [{"createdAt": {"$gt": high_water}}, {"updatedAt": {"$gt": high_water}}]}
+            touched = await run_pipeline(mongo_utils.db.clientorders, [
+                {"$match": changed},
+                {"$group": {"_id": DAY, "hw": {"$max": {"$max": ["$createdAt", "$updatedAt"]}}}},
+            ])
+            days = sorted((row["_id"] for row in touched), key=lambda day: day or "")
+            version = time.time_ns()
+            for i in range(0, len(days), REFRESH_DAY_CHUNK):
+                chunk = days[i:i + REFRESH_DAY_CHUNK]
+                await self.rebuild({"$or": [day_query(day) for day in chunk]}, version, chunk)
+            for row in touched:
+                if row["hw"] is not None and (high_water is None or row["hw"] > high_water):
+                    high_water = row["hw"]
+            await self.save(high_water, covered_until)
+            self.stats["refreshes"] += 1
+            self.stats["days_rebuilt"] += len(days)
+            self.stats["last_refresh_seconds"] = time.perf_counter() - started
+            return len(days)
+        finally:
+            await self.release()
+
+    async def refresh_forever(self):
+        while True:
+            await asyncio.sleep(REFRESH_SECONDS)
+            try:
+                if REFRESH_ENABLED:
+                    await self.refresh()
+                else:
+                    await self.load()
+            except PyMongoError as e:
+                logger.warning("sales rollup refresh failed: %s", e)
+
+    def snapshot(self):
+        state = self.state or {}
+        refreshed_at = state.get("refreshed_at")
+        return {
+            **self.stats,
+            "ready": self.state is not None,
+            "covered_until": state.get("covered_until"),
+            "staleness_seconds": (utc_now() - refreshed_at).total_seconds() if refreshed_at else None,
+        }
+
+    # -- answers --
+
+    async def rollup_totals(self, tyre_docs, first, last):
+        # Same shape as mongo_utils.raw_sales_totals, for the whole days [first, last)
+        days = {"d": {"$lt": day_key(last)}}
+        if first is not None:
+            days["d"]["$gte"] = day_key(first)
+        else:
+            # An unbounded period also counts orders without a createdAt
+            days = {"$or": [days, {"d": None}]}
+        tyre_ids = [tyre["_id"] for tyre in tyre_docs]
+        rollups = mongo_utils.db.sales_daily
+
+        totals = {}
+        if tyre_ids:
+            rows = await mongo_utils.aggregate_all(rollups, [
+                {"$match": {"$and": [days, {"t": {"$in": tyre_ids}}]}},
+                {"$group": {"_id": "$t", "quantity": {"$sum": "$quantity"}, "sales": {"$sum": "$sales"}}},
+            ])
+            totals = {row["_id"]: (row["quantity"], row["sales"]) for row in rows}
+            # Orders with a tyre of one of these brands
+            brands = sorted({tyre.get("brand") or "" for tyre in tyre_docs})
+            order_match = {"b": {"$in": brands}}
+        else:
+            # Like the raw query, no matching tyres means every order in the period
+            order_match = {"b": {"$exists": True}}
+        rows = await mongo_utils.aggregate_all(rollups, [
+            {"$match": {"$and": [days, order_match]}},
+            {"$group": {"_id": None, "orders": {"$sum": "$orders"}}},
+        ])
+        return (rows[0]["orders"] if rows else 0), totals
+
+    async def get_sales(self, product, date_range):
+        if self.state is None:
+            self.stats["raw_answers"] += 1
+            return await mongo_utils.get_sales(product, date_range)
+
+        tyre_docs = await mongo_utils.find_sales_tyres(product)
+        tyre_ids = [tyre["_id"] for tyre in tyre_docs]
+        period = parse_date_range(date_range)
+        start, end = period or (None, None)
+        # Whole days inside the period that the rollups cover; raw orders for the rest
+        first = ceil_day(start) if start is not None else None
+        last = self.state["covered_until"]
+        if end is not None:
+            last = min(last, floor_day(end))
+        if first is not None and first >= last:
+            self.stats["raw_answers"] += 1
+            orders, totals = await mongo_utils.raw_sales_totals(tyre_ids, start, end)
+            return mongo_utils.sales_result(tyre_docs, orders, totals, period)
+
+        parts = [self.rollup_totals(tyre_docs, first, last)]
+        if start is not None and start < first:
+            parts.append(mongo_utils.raw_sales_totals(tyre_ids, start, first))
+        if end is None or last < end:
+            parts.append(mongo_utils.raw_sales_totals(tyre_ids, last, end))
+        self.stats["rollup_answers" if len(parts) == 1 else "mixed_answers"] += 1
+
+        orders, totals = 0, {}
+        for part_orders, part_totals in await asyncio.gather(*parts):
+            orders += part_orders
+            for tyre_id, (quantity, sales) in part_totals.items():
+                previous = totals.get(tyre_id, (0, 0))
+                totals[tyre_id] = (previous[0] + quantity, previous[1] + sales)
+        return mongo_utils.sales_result(tyre_docs, orders, totals, period)
+
+
+rollups = SalesRollups()
+refresh_task = None
+
+
+async def start():
+    global refresh_task
+    try:
+        if await rollups.load() is None:
+            logger.info("no sales rollups yet, answering from raw orders (run: python sales_rollup.py backfill)")
+    except PyMongoError as e:
+        logger.warning("could not load sales rollup state: %s", e)
+    if REFRESH_SECONDS > 0:
+        refresh_task = asyncio.create_task(rollups.refresh_forever())
+
+
+async def stop():
+    if refresh_task is not None:
+        refresh_task.cancel()
+
+
+async def get_sales(product, date_range):
+    return await rollups.get_sales(product, date_range)
+
+
+# -- consistency check --
+
+CHECK_PERIODS = [None, "today", "last 7 days", "last 30 days", "last month", "this year", "last year", "last 3 years"]
+
+
+def compare(rollup, raw):
+    problems = []
+    if rollup["total_orders"] != raw["total_orders"]:
+        problems.append(f"orders {rollup['total_orders']} != {raw['total_orders']}")
+    if rollup["total_quantity"] != raw["total_quantity"]:
+        problems.append(f"quantity {rollup['total_quantity']} != {raw['total_quantity']}")
+    if not math.isclose(rollup["total_sales"], raw["total_sales"], rel_tol=1e-9, abs_tol=1e-6):
+        problems.append(f"sales {rollup['total_sales']} != {raw['total_sales']}")
+    rollup_tyres = {row["tyre"]: (row["quantity"], row["sales"]) for row in rollup["by_tyre"]}
+    raw_tyres = {row["tyre"]: (row["quantity"], row["sales"]) for row in raw["by_tyre"]}
+    differing = [tyre for tyre in rollup_tyres.keys() | raw_tyres.keys()
+                 if rollup_tyres.get(tyre, (0, 0))[0] != raw_tyres.get(tyre, (0, 0))[0]
+                 or not math.isclose(rollup_tyres.get(tyre, (0, 0))[1], raw_tyres.get(tyre, (0, 0))[1], abs_tol=1e-6)]
+    if differing:
+        problems.append(f"{len(differing)} tyres differ, e.g. {differing[0]}")
+    return problems
+
+
+async def check(products=None, periods=None):
+    # Rollup answers against a raw recomputation; returns the number of mismatching cases
+    if await rollups.load() is None:
+        raise RuntimeError("no sales rollups yet, run: python sales_rollup.py backfill")
+    if products is None:
+        products = [None] + sorted(brand for brand in await mongo_utils.get_brands() if isinstance(brand, str))
+    mismatches = 0
+    for product in products:
+        for period in periods or CHECK_PERIODS:
+            rollup = await rollups.get_sales(product, period)
+            raw = await mongo_utils.get_sales(product, period)
+            problems = compare(rollup, raw)
+            if problems:
+                mismatches += 1
+                print(f"MISMATCH {product or '*'} / {period or '*'}: {'; '.join(problems)}")
+    print(f"{len(products) * len(periods or CHECK_PERIODS)} cases, {mismatches} mismatches")
+    return mismatches
+
+
+async def run_command(args):
+    if args.command == "backfill":
+        started = time.perf_counter()
+        await rollups.backfill()
+        print(f"backfilled in {time.perf_counter() - started:.1f}s, covered until {rollups.state['covered_until']:%Y-%m-%d}")
+        return 0
+    if args.command == "refresh":
+        days = await rollups.refresh()
+        if days is None:
+            print("nothing refreshed: no rollups yet, or another process holds the lease")
+            return 1
+        print(f"rebuilt {days} days")
+        return 0
+    return 1 if await check(args.product or None, args.period or None) else 0
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Daily sales rollups over clientorders")
+    parser.add_argument("command", choices=["backfill", "refresh", "check"])
+    parser.add_argument("--product", action="append", help="brand to check (repeatable); default: all brands and none")
+    parser.add_argument("--period", action="append", help="date range to check (repeatable)")
+    args = parser.parse_args()
+    logging.basicConfig(level=logging.INFO)
+    try:
+        sys.exit(asyncio.run(run_command(args)))
+    except RuntimeError as e:
+        print(e, file=sys.stderr)
+        sys.exit(1)
@@ -0,0 +1,216 @@
+import os
+import sys
+import json
+import time
+import asyncio
+import argparse
+import logging
+from datetime import datetime, timedelta, timezone
+from collections import OrderedDict
+
+# Per-session conversation context (brand/intent/size) with TTL and size bounds.
+# SESSION_STORE picks the backend: "memory" (per worker), "mongo" (shared collection
+# with a TTL index) or "socket" (shared in-memory store behind a local Unix socket).
+
+logger = logging.getLogger(__name__)
+
+CONTEXT_KEYS = ("brand", "intent", "size")
+SESSION_TTL_SECONDS = float(os.getenv("SESSION_TTL_SECONDS", "3600"))
+SESSION_MAX = int(os.getenv("SESSION_MAX", "100000"))
+SESSION_SOCKET = os.getenv("SESSION_SOCKET", "/tmp/chat-bot-sessions.sock")
+
+
+def pack(context):
+    return tuple(context.get(key) for key in CONTEXT_KEYS)
+
+
+def unpack(values):
+    return {key: value for key, value in zip(CONTEXT_KEYS, values) if value is not None}
+
+
+class MemorySessionStore:
+    def __init__(self, max_size=SESSION_MAX, ttl=SESSION_TTL_SECONDS):
+        self.max_size = max_size
+        self.ttl = ttl
+        # session_id -> (expires_at, brand, intent, size); kept in last-touched order,
+        # so the oldest entry is always the first to expire
+        self.entries = OrderedDict()
+        self.stats = {"hits": 0, "misses": 0, "evictions": 0, "expirations": 0}
+
+    def prune(self, now):
+        while self.entries:
+            session_id, entry = next(iter(self.entries.items()))
+            if entry[0] > now:
+                break
+            del self.entries[session_id]
+            self.stats["expirations"] += 1
+
+    def get_now(self, session_id):
+        now = time.monotonic()
+        entry = self.entries.get(session_id)
+        if entry is None or entry[0] <= now:
+            self.stats["misses"] += 1
+            self.prune(now)
+            return {}
+        self.entries[session_id] = (now + self.ttl,) + entry[1:]
+        self.entries.move_to_end(session_id)
+        self.stats["hits"] += 1
+        return unpack(entry[1:])
+
+    def set_now(self, session_id, context):
+        now = time.monotonic()
+        self.entries[session_id] = (now + self.ttl,) + pack(context)
+        self.entries.move_to_end(session_id)
+        self.prune(now)
+        while len(self.entries) > self.max_size:
+            self.entries.popitem(last=False)
+            self.stats["evictions"] += 1
+
+    async def get(self, session_id):
+        return self.get_now(session_id)
+
+    async def set(self, session_id, context):
+        self.set_now(session_id, context)
+
+    async def start(self):
+        pass
+
+    async def close(self):
+        pass
+
+    def snapshot(self):
+        return {"backend": "memory", "sessions": len(self.entries), **self.stats}
+
+
+class MongoSessionStore:
+    def __init__(self, collection, ttl=SESSION_TTL_SECONDS):
+        self.collection = collection
+        self.ttl = ttl
+        self.stats = {"hits": 0, "misses": 0}
+
+    async def start(self):
+        # MongoDB removes expired sessions itself; get() also ignores ones awaiting removal
+        await self.collection.create_index("expiresAt", expireAfterSeconds=0)
+
+    async def close(self):
+        pass
+
+    async def get(self, session_id):
+        now = datetime.now(timezone.utc)
+        doc = await self.collection.find_one({"_id": session_id, "expiresAt": {"$gt": now}}, {"c": 1})
+        if doc is None:
+            self.stats["misses"] += 1
+            return {}
+        self.stats["hits"] += 1
+        return unpack(doc["c"])
+
+    async def set(self, session_id, context):
+        expires_at = datetime.now(timezone.utc) + timedelta(seconds=self.ttl)
+        await self.collection.update_one(
+            {"_id": session_id},
+            {"$set": {"c": list(pack(context)), "expiresAt": expires_at}},
+            upsert=True,
+        )
+
+    def snapshot(self):
+        return {"backend": "mongo", **self.stats}
+
+
+class SocketSessionStore:
+    # Client for serve() below; one connection per worker, requests serialized by a lock
+    def __init__(self, path=SESSION_SOCKET):
+        self.path = path
+        self.lock = asyncio.Lock()
+        self.reader = None
+        self.writer = None
+        self.stats = {"requests": 0, "reconnects": 0}
+
+    async def start(self):
+        pass
+
+    async def close(self):
+        if self.writer is not None:
+            self.writer.close()
+            self.writer = None
+
+    async def request(self, message):
+        async with self.lock:
+            for attempt in range(2):
+                try:
+                    if self.writer is None:
+                        self.reader, self.writer = await asyncio.open_unix_connection(self.path)
+                    self.writer.write(json.dumps(message).encode() + b"\n")
+                    await self.writer.drain()
+                    line = await self.reader.readline()
+                    if not line:
+                        raise ConnectionError("session store closed the connection")
+                    self.stats["requests"] += 1
+                    return json.loads(line)
+                except (OSError, ConnectionError):
+                    await self.close()
+                    self.stats["reconnects"] += 1
+                    if attempt:
+                        raise
+
+    async def get(self, session_id):
+        reply = await self.request({"op": "get", "id": session_id})
+        return unpack(reply["c"]) if reply.get("c") else {}
+
+    async def set(self, session_id, context):
+        await self.request({"op": "set", "id": session_id, "c": list(pack(context))})
+
+    def snapshot(self):
+        return {"backend": "socket", "path": self.path, **self.stats}
+
+
+async def serve(path=SESSION_SOCKET, max_size=SESSION_MAX, ttl=SESSION_TTL_SECONDS):
+    store = MemorySessionStore(max_size=max_size, ttl=ttl)
+
+    async def handle(reader, writer):
+        try:
+            while line := await reader.readline():
+                message = json.loads(line)
+                if message["op"] == "get":
+                    context = store.get_now(message["id"])
+                    reply = {"c": list(pack(context)) if context else None}
+                elif message["op"] == "set":
+                    store.set_now(message["id"], unpack(message["c"]))
+                    reply = {"ok": True}
+                else:
+                    reply = {"stats": store.snapshot()}
+                writer.write(json.dumps(reply).encode() + b"\n")
+                await writer.drain()
+        except (ConnectionError, ValueError, KeyError) as e:
+            logger.warning("session store client dropped: %s", e)
+        finally:
+            writer.close()
+
+    if os.path.exists(path):
+        os.unlink(path)
+    server = await asyncio.start_unix_server(handle, path)
+    async with server:
+        await server.serve_forever()
+
+
+def create_session_store(backend=None):
+    backend = backend or os.getenv("SESSION_STORE", "memory")
+    if backend == "mongo":
+        import mongo_utils
+        return MongoSessionStore(mongo_utils.db[os.getenv("SESSION_COLLECTION", "sessions")])
+    if backend == "socket":
+        return SocketSessionStore()
+    return MemorySessionStore()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Shared session store for multiple uvicorn workers")
+    parser.add_argument("command", choices=["serve"])
+    parser.add_argument("--path", default=SESSION_SOCKET)
+    parser.add_argument("--max-size", type=int, default=SESSION_MAX)
+    parser.add_argument("--ttl", type=float, default=SESSION_TTL_SECONDS)
+    args = parser.parse_args()
+    logging.basicConfig(level=logging.INFO)
+    try:
+        asyncio.run(serve(args.path, args.max_size, args.ttl))
+    except KeyboardInterrupt:
+        sys.exit(0)
@@ -0,0 +1,72 @@
+import asyncio
+import random
+
+import mongomock
+import pytest
+
+import mongo_utils
+from catalog import CatalogIndex
+from fakes import BRANDS, SIZES, MockAsyncDatabase, make_tyres
+
+BRAND_QUERIES = [None] + BRANDS + ["m", "goo", "nobody"]
+
+
+@pytest.fixture
+def tyres(monkeypatch):
+    sync_db = mongomock.MongoClient().tyres
+    docs = make_tyres(300, 1)
+    # A size listed twice in one tyre's stock
+    docs[0]["stock"] = [{"size": SIZES[0]}, {"size": SIZES[0]}]
+    sync_db.addtyres.insert_many(docs)
+    monkeypatch.setattr(mongo_utils, "db", MockAsyncDatabase(sync_db, latency=0))
+    return sync_db.addtyres
+
+
+def build(index):
+    asyncio.run(index.build())
+    return index
+
+
+def unordered(result):
+    # After updates the index keeps its own order, which need not match Mongo's
+    if not isinstance(result, dict):
+        return result
+    return {key: sorted(map(repr, value)) if isinstance(value, list) else value for key, value in result.items()}
+
+
+def assert_matches_mongo(index):
+    async def compare():
+        for brand in BRAND_QUERIES:
+            for intent in ("list_models", "list_sizes"):
+                for size in [None] + SIZES[:4]:
+                    expected = await mongo_utils.get_models_and_sizes(brand, intent, size)
+                    assert unordered(index.get_models_and_sizes(brand, intent, size)) == unordered(expected)
+            assert index.get_tubeless_sizes(brand) == await mongo_utils.get_tubeless_sizes(brand)
+        for size in SIZES + ["1/1R1"]:
+            assert unordered(index.get_type_by_size(size)) == unordered(await mongo_utils.get_type_by_size(size))
+
+    asyncio.run(compare())
+
+
+def test_built_index_matches_mongo(tyres):
+    assert_matches_mongo(build(CatalogIndex()))
+
+
+def test_updated_index_matches_mongo(tyres):
+    index = build(CatalogIndex())
+    rng = random.Random(3)
+    for doc in rng.sample(list(tyres.find()), 40):
+        doc.update(
+            brand=rng.choice(BRANDS),
+            type=rng.choice(["Tubeless", "Tube", None]),
+            stock=[{"size": size} for size in rng.sample(SIZES, 2)],
+        )
+        tyres.replace_one({"_id": doc["_id"]}, doc)
+        index.add(doc)
+    for doc in list(tyres.find().limit(10)):
+        tyres.delete_one({"_id": doc["_id"]})
+        index.remove(doc["_id"])
+    for doc in make_tyres(5, 2):
+        tyres.insert_one(doc)
+        index.add(doc)
+    assert_matches_mongo(index)
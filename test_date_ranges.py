@@ -0,0 +1,93 @@
+from datetime import datetime
+
+import pytest
+
+from date_ranges import find_date_phrase, means_all_time, parse_date_range
+
+NOW = datetime(2025, 6, 15, 10, 30)
+
+
+def d(year, month, day=1):
+    return datetime(year, month, day)
+
+
+@pytest.mark.parametrize("text, expected", [
+    ("today", (d(2025, 6, 15), d(2025, 6, 16))),
+    ("yesterday", (d(2025, 6, 14), d(2025, 6, 15))),
+    ("last year", (d(2024, 1), d(2025, 1))),
+    ("this year", (d(2025, 1), d(2026, 1))),
+    ("last month", (d(2025, 5), d(2025, 6))),
+    ("last quarter", (d(2025, 1), d(2025, 4))),
+    ("last week", (d(2025, 6, 2), d(2025, 6, 9))),
+    ("Q2 2024", (d(2024, 4), d(2024, 7))),
+    ("march 2024", (d(2024, 3), d(2024, 4))),
+    ("dec", (d(2024, 12), d(2025, 1))),
+    ("2023", (d(2023, 1), d(2024, 1))),
+    ("last 30 days", (d(2025, 5, 16), d(2025, 6, 16))),
+    ("last 3 months", (d(2025, 3, 15), d(2025, 6, 16))),
+    ("last six months", (d(2024, 12, 15), d(2025, 6, 16))),
+    ("last 2 quarters", (d(2024, 12, 15), d(2025, 6, 16))),
+    ("past week", (d(2025, 6, 8), d(2025, 6, 16))),
+    ("past year", (d(2024, 6, 15), d(2025, 6, 16))),
+    ("2024-01-15", (d(2024, 1, 15), d(2024, 1, 16))),
+    ("2024-02", (d(2024, 2), d(2024, 3))),
+    ("2024-01-15 to 2024-02-15", (d(2024, 1, 15), d(2024, 2, 16))),
+    ("2024-01-15 - 2024-02-15", (d(2024, 1, 15), d(2024, 2, 16))),
+    ("jan 2024 to mar 2024", (d(2024, 1), d(2024, 4))),
+    ("jan-mar 2024", (d(2024, 1), d(2024, 4))),
+    ("nov 2023 to feb 2024", (d(2023, 11), d(2024, 3))),
+    ("between 2022 and 2023", (d(2022, 1), d(2024, 1))),
+    ("2023-2024", (d(2023, 1), d(2025, 1))),
+    ("since 2023", (d(2023, 1), d(2025, 6, 16))),
+    ("since last year", (d(2024, 1), d(2025, 6, 16))),
+    ("since 2024-03-01", (d(2024, 3, 1), d(2025, 6, 16))),
+    ("since 2023 to now", (d(2023, 1), d(2025, 6, 16))),
+    ("from 2023 to now", (d(2023, 1), d(2025, 6, 16))),
+    ("jan 2025 until today", (d(2025, 1), d(2025, 6, 16))),
+    ("march 15 2024", (d(2024, 3, 15), d(2024, 3, 16))),
+    ("15 March 2024", (d(2024, 3, 15), d(2024, 3, 16))),
+    ("on the 15th of march", (d(2025, 3, 15), d(2025, 3, 16))),
+    ("june 20", (d(2024, 6, 20), d(2024, 6, 21))),
+    ("may", (d(2025, 5), d(2025, 6))),
+    ("2024 q1", (d(2024, 1), d(2024, 4))),
+    ("q1 of 2024", (d(2024, 1), d(2024, 4))),
+    ("first quarter of 2024", (d(2024, 1), d(2024, 4))),
+    ("in the 3rd quarter", (d(2025, 7), d(2025, 10))),
+    ("first half of 2024", (d(2024, 1), d(2024, 7))),
+    ("h2 2024", (d(2024, 7), d(2025, 1))),
+    ("last 3 weeks of 2024", (d(2024, 12, 11), d(2025, 1))),
+    ("last 2 months of 2024", (d(2024, 11), d(2025, 1))),
+    ("during the year 2023", (d(2023, 1), d(2024, 1))),
+])
+def test_parse_date_range(text, expected):
+    assert parse_date_range(text, NOW) == expected
+
+
+@pytest.mark.parametrize("text", [
+    None, "", "the festive season", "2024-13-01", "may we",
+    # Extra words are not ignored
+    "this fortnight", "last year please", "diwali 2024", "2024 to the festive season", "march 32 2024",
+])
+def test_unparseable(text):
+    assert parse_date_range(text, NOW) is None
+
+
+@pytest.mark.parametrize("question, phrase", [
+    ("MRF sales last year?", "last year"),
+    ("MRF sales since 2023?", "since 2023"),
+    ("sales from 2024-01-15 to 2024-02-15", "2024-01-15 to 2024-02-15"),
+    ("What did we sell in the past week", "past week"),
+    ("Michelin sales", None),
+    ("MRF sales in the first quarter of 2024?", "first quarter of 2024"),
+    ("MRF sales on 15 March 2024", "15 March 2024"),
+    ("MRF sales last year please", "last year"),
+    ("sales from 2023 to now", "2023 to now"),
+    ("jan 2024 to mar 2024 sales", "jan 2024 to mar 2024"),
+])
+def test_find_date_phrase(question, phrase):
+    assert find_date_phrase(question) == phrase
+
+
+def test_means_all_time():
+    assert means_all_time("all time")
+    assert not means_all_time("the festive season")
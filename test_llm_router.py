@@ -0,0 +1,152 @@
+import asyncio
+
+import pytest
+
+import query_parser
+from fakes import FakeProvider
+from llm_router import CircuitBreaker, LLMRouter, NoProviderAvailable, Provider
+
+
+@pytest.fixture(autouse=True)
+def brands():
+    query_parser.set_brands(["MRF", "Michelin"])
+
+
+def provider(name, breaker=None, **kwargs):
+    return Provider(name, FakeProvider(name, **kwargs), breaker)
+
+
+def extract(router, question="MRF sales last year"):
+    return asyncio.run(router.extract_query_info(question))
+
+
+def test_breaker_stays_closed_below_the_threshold():
+    breaker = CircuitBreaker(failure_threshold=3, reset_timeout=60)
+    breaker.record_failure()
+    breaker.record_failure()
+    assert breaker.state == "closed" and breaker.allow()
+    breaker.record_success()
+    breaker.record_failure()
+    breaker.record_failure()
+    assert breaker.state == "closed"
+
+
+def test_breaker_opens_at_the_threshold():
+    breaker = CircuitBreaker(failure_threshold=2, reset_timeout=60)
+    breaker.record_failure()
+    breaker.record_failure()
+    assert breaker.state == "open"
+    assert not breaker.allow()
+
+
+def test_half_open_breaker_allows_one_probe():
+    breaker = CircuitBreaker(failure_threshold=1, reset_timeout=0)
+    breaker.record_failure()
+    assert breaker.state == "half_open"
+    assert breaker.allow()
+    assert not breaker.allow()
+
+
+def test_successful_probe_closes_the_breaker():
+    breaker = CircuitBreaker(failure_threshold=1, reset_timeout=0)
+    breaker.record_failure()
+    assert breaker.allow()
+    breaker.record_success()
+    assert breaker.state == "closed"
+
+
+def test_failed_probe_reopens_the_breaker():
+    breaker = CircuitBreaker(failure_threshold=3, reset_timeout=0)
+    for _ in range(3):
+        breaker.record_failure()
+    assert breaker.allow()
+    breaker.reset_timeout = 60
+    breaker.record_failure()
+    assert breaker.state == "open"
+
+
+def test_cancelled_probe_frees_the_slot():
+    groq = provider("groq", CircuitBreaker(failure_threshold=1, reset_timeout=0), latency=1)
+    groq.breaker.record_failure()
+    assert groq.breaker.allow()
+
+    async def cancel():
+        task = asyncio.ensure_future(groq.call("MRF sales", None, timeout=5))
+        await asyncio.sleep(0.01)
+        task.cancel()
+        with pytest.raises(asyncio.CancelledError):
+            await task
+
+    asyncio.run(cancel())
+    assert groq.breaker.failures == 1
+    assert groq.breaker.allow()
+
+
+def test_primary_answers_without_a_hedge():
+    groq, gemini = provider("groq", latency=0.01), provider("gemini", latency=0.01)
+    info = extract(LLMRouter([groq, gemini], min_hedge_delay=0.2, timeout=1))
+    assert info["brand"] == "MRF"
+    assert (groq.stats["wins"], gemini.stats["calls"]) == (1, 0)
+
+
+def test_slow_primary_is_hedged():
+    groq, gemini = provider("groq", latency=1), provider("gemini", latency=0.01)
+    extract(LLMRouter([groq, gemini], min_hedge_delay=0.05, timeout=2))
+    assert gemini.stats["hedges"] == 1
+    assert gemini.stats["wins"] == 1
+    assert groq.breaker.failures == 0
+
+
+def test_failed_primary_fails_over():
+    groq, gemini = provider("groq", latency=0.01), provider("gemini", latency=0.01)
+    groq.extract.down = True
+    info = extract(LLMRouter([groq, gemini], min_hedge_delay=1, timeout=2))
+    assert info["brand"] == "MRF"
+    assert groq.stats["failures"] == 1 and gemini.stats["wins"] == 1
+
+
+def test_open_breaker_skips_the_provider():
+    groq = provider("groq", CircuitBreaker(failure_threshold=1, reset_timeout=60), latency=0.01)
+    gemini = provider("gemini", latency=0.01)
+    groq.breaker.record_failure()
+    extract(LLMRouter([groq, gemini], timeout=1))
+    assert groq.extract.calls == 0 and gemini.stats["wins"] == 1
+
+
+def test_unusable_reply_falls_through_without_tripping_the_breaker():
+    async def empty(user_question, previous_context=None):
+        return {}
+
+    groq, gemini = Provider("groq", empty), provider("gemini", latency=0.01)
+    info = extract(LLMRouter([groq, gemini], min_hedge_delay=1, timeout=1))
+    assert info["brand"] == "MRF"
+    assert groq.stats["unusable"] == 1 and groq.breaker.failures == 0
+
+
+def test_last_error_is_raised_when_every_provider_fails():
+    groq = provider("groq", latency=0.01)
+    groq.extract.down = True
+    with pytest.raises(ConnectionError):
+        extract(LLMRouter([groq], timeout=1))
+
+
+def test_no_provider_available():
+    groq = provider("groq", CircuitBreaker(failure_threshold=1, reset_timeout=60))
+    groq.breaker.record_failure()
+    with pytest.raises(NoProviderAvailable):
+        extract(LLMRouter([groq], timeout=1))
+
+
+def test_cold_router_hedges_after_the_minimum_delay():
+    groq = provider("groq")
+    assert LLMRouter([groq], min_hedge_delay=0.25, timeout=10).delay_for(groq) == 0.25
+
+
+def test_slow_call_that_loses_the_race_raises_the_p95():
+    groq, gemini = provider("groq", latency=0.01), provider("gemini", latency=0.01)
+    router = LLMRouter([groq, gemini], min_hedge_delay=0.02, timeout=2)
+    extract(router)
+    groq.extract.latency = 0.5
+    extract(router)
+    assert gemini.stats["wins"] == 1
+    assert groq.latency.quantile(0.95) > 0.02
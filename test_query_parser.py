@@ -0,0 +1,72 @@
+import pytest
+
+import query_parser
+from query_parser import MIN_CONFIDENCE, parse_query
+
+
+@pytest.fixture(autouse=True)
+def brands():
+    query_parser.set_brands(["MRF", "Michelin", "BF Goodrich", "Goodrich"])
+
+
+@pytest.mark.parametrize("question, intent, brand, size", [
+    ("List all MRF models", "list_models", "MRF", None),
+    ("What sizes does Michelin have?", "list_sizes", "Michelin", None),
+    ("Which types come in 195/65R15?", "get_type_by_size", None, "195/65R15"),
+    ("How many types for 195/65 R15", "count_type_by_size", None, "195/65R15"),
+    ("Show models for 195/65R15", "models_and_types_by_size", None, "195/65R15"),
+    ("Tubeless sizes for MRF", "tubeless_sizes_by_brand", "MRF", None),
+    ("MRF sales last year", "get_sales", "MRF", None),
+    ("BF Goodrich models", "list_models", "BF Goodrich", None),
+])
+def test_confident_answers(question, intent, brand, size):
+    info = parse_query(question)
+    assert (info["intent"], info["brand"], info["size"]) == (intent, brand, size)
+    assert info["confidence"] >= MIN_CONFIDENCE
+
+
+@pytest.mark.parametrize("question", [
+    # Keywords for more than one intent
+    "What sizes can I order for MRF?",
+    "Which models sold best?",
+    # A parsed slot the chosen intent would ignore
+    "Do you sell 195/65R15 tyres?",
+    "MRF models in 195/65R15",
+    # A period the date parser does not cover
+    "MRF sales during the festive season",
+    "MRF sales for diwali",
+    "how many MRF orders this fortnight",
+])
+def test_ambiguous_questions_go_to_the_llm(question):
+    assert parse_query(question)["confidence"] < MIN_CONFIDENCE
+
+
+def test_unrecognized_question():
+    assert parse_query("Give me the construction of 215/60R16")["confidence"] == 0.0
+
+
+def test_missing_slot_goes_to_the_llm():
+    assert parse_query("what sizes does it come in?")["confidence"] < MIN_CONFIDENCE
+
+
+def test_slot_from_context_is_filled_but_not_trusted():
+    info = parse_query("what sizes does it come in?", {"brand": "MRF"})
+    assert info["brand"] == "MRF"
+    assert info["confidence"] < MIN_CONFIDENCE
+
+
+def test_date_phrase_is_kept_for_sales():
+    info = parse_query("MRF sales from jan 2024 to mar 2024")
+    assert info["date_range"] == "jan 2024 to mar 2024"
+
+
+@pytest.mark.parametrize("question, date_range", [
+    ("MRF sales in the first quarter of 2024", "first quarter of 2024"),
+    ("MRF sales on 15 March 2024", "15 March 2024"),
+    ("What were the sales for MRF last year?", "last year"),
+    ("Sales for BF Goodrich since 2023", "since 2023"),
+])
+def test_whole_period_is_read(question, date_range):
+    info = parse_query(question)
+    assert info["date_range"] == date_range
+    assert info["confidence"] >= MIN_CONFIDENCE
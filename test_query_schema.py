@@ -0,0 +1,37 @@
+import pytest
+
+from query_schema import normalize_info, parse_response
+
+
+def test_normalize_info():
+    info = normalize_info({"brand": " MRF ", "intent": "list_sizes", "size": "195/65 r15", "date_range": "null"})
+    assert info == {"brand": "MRF", "intent": "list_sizes", "size": "195/65R15", "date_range": None}
+
+
+def test_unknown_intent_is_answered_as_sales():
+    assert normalize_info({"intent": "best_sellers"})["intent"] == "get_sales"
+
+
+@pytest.mark.parametrize("field, value", [
+    ("date_range", {"start": "2024-01-01", "end": "2024-03-31"}),
+    ("brand", ["MRF", "CEAT"]),
+    ("size", 15),
+    ("intent", ["list_models"]),
+    ("brand", True),
+])
+def test_non_string_values_become_none(field, value):
+    info = normalize_info({"brand": "MRF", "intent": "get_sales", "size": None, "date_range": "last year", field: value})
+    assert info[field] is None
+    assert all(value is None or isinstance(value, str) for value in info.values())
+
+
+@pytest.mark.parametrize("content", ["[1, 2]", '"list_models"', "42"])
+def test_non_object_replies_are_unparsed(content):
+    assert parse_response(content, "anything") is None
+
+
+def test_parse_response_with_nested_date_range():
+    content = '```json\n{"brand": ["MRF"], "intent": "get_sales", "size": null, "date_range": {"start": "2024-01-01"}}\n```'
+    assert parse_response(content, "MRF sales", {"brand": "CEAT"}) == {
+        "brand": "CEAT", "intent": "get_sales", "size": None, "date_range": None,
+    }